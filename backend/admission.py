@@ -0,0 +1,171 @@
+# admission.py
+"""
+Admission control: per-class concurrency limits in front of the expensive
+endpoints, so they can't crowd cheap reads off the event loop and the DB
+pool.
+
+    login     POST /charities/login                      bcrypt
+    write     register, edit, delete, /admin writes      bcrypt, Mapbox, DB writes
+    upstream  /api/suggest, /api/retrieve, /api/zip      Mapbox
+
+Everything else, the map reads in particular, is admitted at once: reads
+are served from cache, and their latency is what the limits protect.
+(Cache-miss list rebuilds are already single-flight per worker.)
+
+Each class runs at most `limit` requests per worker and queues up to
+`queue` more in FIFO order. A request is shed with 503 and Retry-After
+when the queue is full, or when the wait predicted from the recent
+service time would exceed the class's latency target, or when it does
+wait that long. Shedding at admission is cheaper than timing out later.
+
+Settings per class: ADMISSION_<CLASS>_LIMIT, _QUEUE, _WAIT_MS.
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from starlette.responses import JSONResponse
+
+import metrics
+
+
+# Weight of the newest request in the service time average.
+EWMA_ALPHA = 0.2
+
+admission_shed = metrics.Counter(
+    "admission_shed_total", "Requests rejected by admission control.", ("class", "reason")
+)
+admission_wait = metrics.Histogram(
+    "admission_wait_seconds", "Time admitted requests waited in the admission queue.", ("class",)
+)
+
+
+class Limiter:
+    def __init__(self, name: str, limit: int, queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.service_time = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        metrics.Gauge(f"admission_{name}_in_flight", f"{name} requests running.", lambda: self.in_flight)
+        metrics.Gauge(f"admission_{name}_queued", f"{name} requests waiting for admission.", lambda: len(self._waiters))
+
+    def predicted_wait(self) -> float:
+        return (len(self._waiters) + 1) * self.service_time / self.limit
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.predicted_wait()))
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot, waiting if needed; returns why the request was shed, or None once admitted."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return None
+        if len(self._waiters) >= self.queue:
+            return "queue_full"
+        if self.predicted_wait() > self.max_wait:
+            return "latency"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait((waiter,), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            return "timeout"
+        admission_wait.observe(time.perf_counter() - start, self.name)
+        return None
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # Handed a slot just as we gave up; pass it on.
+            self.release(None)
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def release(self, elapsed: Optional[float]) -> None:
+        if elapsed is not None:
+            self.service_time += EWMA_ALPHA * (elapsed - self.service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot moves to the waiter
+                return
+        self.in_flight -= 1
+
+
+def _limiter(name: str, limit: int, queue: int, wait_ms: int) -> Limiter:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return Limiter(
+        name,
+        limit=int(os.getenv(prefix + "LIMIT", str(limit))),
+        queue=int(os.getenv(prefix + "QUEUE", str(queue))),
+        max_wait=int(os.getenv(prefix + "WAIT_MS", str(wait_ms))) / 1000,
+    )
+
+
+_CPUS = os.cpu_count() or 1
+
+limiters = {
+    "login": _limiter("login", limit=8 * _CPUS, queue=64, wait_ms=2000),
+    "write": _limiter("write", limit=16, queue=64, wait_ms=3000),
+    "upstream": _limiter("upstream", limit=32, queue=128, wait_ms=1000),
+}
+
+_RULES = (
+    ("POST", re.compile(r"/charities/login/?$"), "login"),
+    ("POST", re.compile(r"/charities/?$"), "write"),
+    ("PATCH", re.compile(r"/charities/\d+/edit/?$"), "write"),
+    ("DELETE", re.compile(r"/charities/\d+/?$"), "write"),
+    ("POST", re.compile(r"/admin/"), "write"),
+    ("GET", re.compile(r"/api/(suggest|retrieve|zip)(/|$)"), "upstream"),
+)
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    for rule_method, pattern, name in _RULES:
+        if method == rule_method and pattern.match(path):
+            return name
+    return None
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the limiters above."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        limiter = limiters[name]
+        shed = await limiter.acquire()
+        if shed is not None:
+            admission_shed.inc(name, shed)
+            response = JSONResponse(
+                {"detail": "Server busy, try again shortly"},
+                status_code=503,
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+            return await response(scope, receive, send)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
@@ -0,0 +1,140 @@
+# breaker.py
+"""
+Circuit breakers for the dependencies we can live without for a while.
+
+closed     calls go through; `failure_threshold` failures in a row open it
+open       calls fail at once with CircuitOpen for `reset_timeout` seconds
+half-open  one probe call goes through; success closes the circuit,
+           failure opens it again
+
+Failing fast keeps requests from queueing behind a dead dependency;
+callers catch the error and fall back (see charity_cache, rate_limit,
+geocode).
+"""
+import os
+import time
+from typing import Optional
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+import metrics
+
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = ("closed", "half-open", "open")
+
+circuit_opens = metrics.Counter("circuit_opens_total", "Times a circuit breaker opened.", ("breaker",))
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class RedisCircuitOpen(CircuitOpen, RedisConnectionError):
+    """Raised instead of a Redis call; code handling Redis errors handles this too."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None
+        metrics.Gauge(f"{name}_circuit_state", f"{name} circuit: 0 closed, 1 half-open, 2 open.", lambda: self.state)
+
+    @property
+    def state(self) -> int:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def acquire(self, error: type = CircuitOpen) -> None:
+        """Raise `error` unless a call may go through now."""
+        state = self.state
+        if state == CLOSED:
+            return
+        now = time.monotonic()
+        if state == HALF_OPEN:
+            # One probe at a time; a probe that never reported back (e.g.
+            # cancelled) is replaced after another reset_timeout.
+            if self.probe_started is None or now - self.probe_started >= self.reset_timeout:
+                self.probe_started = now
+                return
+        raise error(self.name, max(self.opened_at + self.reset_timeout - now, 1.0))
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                circuit_opens.inc(self.name)
+            self.opened_at = time.monotonic()
+            self.probe_started = None
+
+
+redis_breaker = CircuitBreaker(
+    "redis",
+    failure_threshold=int(os.getenv("REDIS_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("REDIS_BREAKER_RESET", "5")),
+)
+mapbox_breaker = CircuitBreaker(
+    "mapbox",
+    failure_threshold=int(os.getenv("MAPBOX_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("MAPBOX_BREAKER_RESET", "30")),
+)
+
+# Errors that mean Redis itself is unhealthy. Others (WRONGTYPE, WatchError,
+# script errors) come from a working server and don't count.
+_REDIS_FAILURES = (RedisConnectionError, RedisTimeoutError, OSError)
+
+
+class GuardedPipeline(metrics.InstrumentedPipeline):
+    async def execute(self, raise_on_error: bool = True):
+        redis_breaker.acquire(RedisCircuitOpen)
+        try:
+            result = await super().execute(raise_on_error)
+        except _REDIS_FAILURES:
+            redis_breaker.failure()
+            raise
+        redis_breaker.success()
+        return result
+
+    async def immediate_execute_command(self, *args, **options):
+        # WATCH and the reads between WATCH and MULTI.
+        redis_breaker.acquire(RedisCircuitOpen)
+        try:
+            result = await super().immediate_execute_command(*args, **options)
+        except _REDIS_FAILURES:
+            redis_breaker.failure()
+            raise
+        redis_breaker.success()
+        return result
+
+
+class GuardedRedis(metrics.InstrumentedRedis):
+    """Redis client behind `redis_breaker`; set socket timeouts so a hung server fails too."""
+
+    async def execute_command(self, *args, **options):
+        redis_breaker.acquire(RedisCircuitOpen)
+        try:
+            result = await super().execute_command(*args, **options)
+        except _REDIS_FAILURES:
+            redis_breaker.failure()
+            raise
+        redis_breaker.success()
+        return result
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> GuardedPipeline:
+        return GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
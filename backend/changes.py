@@ -0,0 +1,208 @@
+# changes.py
+"""
+Live feed of charity changes for GET /charities/changes (Server-Sent Events).
+
+Every write appends a delta to the Redis stream `charities:changes` in the
+same transaction that updates the list cache, so the feed never disagrees
+with /charities. Stream entry ids double as SSE event ids: a reconnecting
+browser sends Last-Event-ID and gets the entries it missed with XRANGE.
+
+Each worker runs one blocking XREAD loop and fans entries out to its
+clients through in-process queues, so an idle client costs a coroutine and
+a queue, not a Redis connection. The loop only runs while a client is
+connected.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import AsyncIterator, Optional, Set, Tuple
+
+import redis.asyncio as redis
+
+from metrics import Gauge
+
+
+STREAM_KEY = "charities:changes"
+# Approximate number of deltas kept for resuming clients.
+STREAM_MAXLEN = int(os.getenv("CHANGES_MAXLEN", "10000"))
+# Comment line sent on idle connections so proxies keep them open.
+HEARTBEAT_SECONDS = int(os.getenv("CHANGES_HEARTBEAT", "15"))
+# Deltas buffered per client; a client that falls this far behind is
+# disconnected and resumes from its Last-Event-ID.
+CLIENT_QUEUE_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+def add(pipe: redis.client.Pipeline, op: str, id: int, data: Optional[str] = None) -> None:
+    """
+    Queue a delta on a pipeline. `op` is "upsert" (with the entry JSON),
+    "delete", or "reset" when deltas were lost and clients should refetch.
+    """
+    fields = {"op": op, "id": id}
+    if data is not None:
+        fields["data"] = data
+    pipe.xadd(STREAM_KEY, fields, maxlen=STREAM_MAXLEN, approximate=True)
+
+
+def _parse_id(entry_id: str) -> Tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def format_event(entry_id: str, fields: dict) -> str:
+    if fields["op"] == "upsert":
+        data = fields["data"]
+    elif fields["op"] == "delete":
+        data = json.dumps({"id": int(fields["id"])})
+    else:
+        data = "{}"
+    return f"id: {entry_id}\nevent: {fields['op']}\ndata: {data}\n\n"
+
+
+def control_event(event: str, entry_id: str) -> str:
+    """
+    `ready` opens a fresh connection; `reset` tells a resuming client that
+    part of what it missed was trimmed (or never recorded), so it should
+    refetch /charities.
+    Both carry the current stream position as their id.
+    """
+    return f"id: {entry_id}\nevent: {event}\ndata: {{}}\n\n"
+
+
+async def latest_id(r: redis.Redis) -> str:
+    latest = await r.xrevrange(STREAM_KEY, count=1)
+    return latest[0][0] if latest else "0-0"
+
+
+class Broadcaster:
+    def __init__(self, r: redis.Redis):
+        self.r = r
+        self.clients: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._started: Optional[asyncio.Future] = None
+
+    async def subscribe(self) -> asyncio.Queue:
+        """
+        Register a client. Returns once the read loop has its starting
+        position, so every entry added after this returns reaches the queue.
+        """
+        queue: asyncio.Queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self.clients.add(queue)
+        if self._task is None or self._task.done():
+            self._started = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._run(self._started))
+        try:
+            await asyncio.shield(self._started)
+        except BaseException:
+            self.clients.discard(queue)
+            raise
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.clients.discard(queue)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _run(self, started: asyncio.Future) -> None:
+        # Read from the stream position at subscribe time rather than "$",
+        # which would skip entries added before the first XREAD.
+        try:
+            last_id = await latest_id(self.r)
+        except asyncio.CancelledError:
+            started.cancel()
+            raise
+        except Exception as e:
+            started.set_exception(e)
+            raise
+        started.set_result(None)
+        while self.clients:
+            try:
+                result = await self.r.xread({STREAM_KEY: last_id}, block=HEARTBEAT_SECONDS * 1000, count=100)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("charity change feed read failed: %r", e)
+                await asyncio.sleep(1)
+                continue
+            for _, entries in result or ():
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    self._fan_out(entry_id, fields)
+
+    def _fan_out(self, entry_id: str, fields: dict) -> None:
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait((entry_id, fields))
+            except asyncio.QueueFull:
+                # Too slow; close it and let the browser resume.
+                self.clients.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+async def events(b: Broadcaster, last_event_id: Optional[str]) -> AsyncIterator[str]:
+    """SSE body for one client: missed deltas first, then live ones."""
+    queue = await b.subscribe()
+    try:
+        sent = None
+        if last_event_id:
+            try:
+                sent = _parse_id(last_event_id)
+            except ValueError:
+                pass
+        if sent is None:
+            current = await latest_id(b.r)
+            yield "retry: 3000\n\n" + control_event("ready", current)
+            sent = _parse_id(current)
+        else:
+            first = await b.r.xrange(STREAM_KEY, count=1)
+            if first and _parse_id(first[0][0]) > sent:
+                current = await latest_id(b.r)
+                yield control_event("reset", current)
+                sent = _parse_id(current)
+            else:
+                for entry_id, fields in await b.r.xrange(STREAM_KEY, min=last_event_id):
+                    if _parse_id(entry_id) > sent:
+                        yield format_event(entry_id, fields)
+                        sent = _parse_id(entry_id)
+
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if item is None:
+                return
+            entry_id, fields = item
+            if _parse_id(entry_id) <= sent:
+                continue  # already sent from the stream
+            yield format_event(entry_id, fields)
+    finally:
+        b.unsubscribe(queue)
+
+
+_broadcasters: Set[Broadcaster] = set()
+
+
+def broadcaster(r: redis.Redis) -> Broadcaster:
+    """The worker's broadcaster, created in the lifespan."""
+    b = Broadcaster(r)
+    _broadcasters.add(b)
+    return b
+
+
+def client_count() -> int:
+    return sum(len(b.clients) for b in _broadcasters)
+
+
+Gauge("charity_changes_clients", "Clients connected to the charity change feed.", client_count)
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import os
+import secrets
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError, WatchError
+from sqlmodel import select
+
+import changes
+import metrics
+from profiling import span
+from deps import ReadSessionLocal, SessionLocal
+from models.dbmodels import Charity
+from models.outmodels import CharityRead
+
+
+# One hash field per charity holding its encoded CharityRead. Writes update
+# their own field in place; the full list is the concatenation of the values.
+ENTRIES_KEY = "charities:entries"
+# Set when ENTRIES_KEY holds every charity, i.e. after a full rebuild. Holds
+# the highest revision that rebuild read from the database: every revision
+# up to it is in the list, so it is a safe `since` for delta sync. The
+# highest revision in the list itself is not, since writers can reach Redis
+# in a different order than they committed.
+READY_KEY = "charities:entries:ready"
+VER_KEY = "charities:ver"
+# Ids of deleted charities, so an edit that reaches Redis after the delete
+# cannot bring the charity back. Ids are never reused.
+DELETED_KEY = "charities:entries:deleted"
+# Random id that is part of every list tag. If Redis loses its data (a
+# flush, or failover to an empty replica) the version restarts from 0, but
+# the epoch is regenerated with it, so tags cached by workers, the snapshot
+# files and the compression cache never match the new list by accident.
+EPOCH_KEY = "charities:epoch"
+ENTRIES_TTL = 3600
+# The warmer rebuilds the list this long before it would expire, so readers
+# never find it cold. Only one worker per interval does the rebuild.
+WARM_INTERVAL = int(os.getenv("CACHE_WARM_INTERVAL", "60"))
+WARM_MARGIN = int(os.getenv("CACHE_WARM_MARGIN", "600"))
+WARM_LOCK_KEY = "charities:entries:warm_lock"
+
+# While Redis is unavailable the list is read from the database and kept in
+# this worker for LOCAL_TTL seconds, so an outage doesn't put every list
+# request on Postgres.
+LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", "5"))
+
+logger = logging.getLogger(__name__)
+
+# put_entries, for writers that reach Redis in a different order than they
+# committed. ARGV holds (id, revision, entry) triples after the stream
+# length. An entry is written only if the stored one is older, and it is
+# published to the change feed unless a newer one already was; an equal
+# revision was stored by a read-through fill, which publishes nothing.
+# The version is bumped only when something was published.
+# Returns {version, list is ready}.
+_PUT_ENTRIES_LUA = """
+local published = 0
+for i = 2, #ARGV, 3 do
+    local id, rev, entry = ARGV[i], tonumber(ARGV[i + 1]), ARGV[i + 2]
+    if redis.call('SISMEMBER', KEYS[5], id) == 0 then
+        local stored = redis.call('HGET', KEYS[1], id)
+        local stored_rev = -1
+        if stored then
+            stored_rev = tonumber(cjson.decode(stored)['revision']) or -1
+        end
+        if stored_rev < rev then
+            redis.call('HSET', KEYS[1], id, entry)
+        end
+        if stored_rev <= rev then
+            redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[1], '*', 'op', 'upsert', 'id', id, 'data', entry)
+            published = published + 1
+        end
+    end
+end
+local ver
+if published > 0 then
+    ver = redis.call('INCR', KEYS[2])
+else
+    ver = tonumber(redis.call('GET', KEYS[2]) or '0')
+end
+return {ver, redis.call('EXISTS', KEYS[3])}
+"""
+
+_rebuild_task: Optional[asyncio.Task] = None
+_local_list: Optional[Tuple[float, str, str, int]] = None
+_local_task: Optional[asyncio.Task] = None
+# Set when a write could not reach Redis; the warmer then rebuilds the list
+# as soon as Redis is back, since the cached entry is stale.
+_missed_write = False
+
+
+def encode_entry(charity: Charity) -> str:
+    with span("serialize", "charity"):
+        return CharityRead.model_validate(charity).model_dump_json()
+
+
+async def get_ver(r: redis.Redis) -> int:
+    v = await r.get(VER_KEY)
+    return int(v) if v is not None else 0
+
+
+def _tag(epoch: str, ver: int) -> str:
+    return f"v{epoch}-{ver}"
+
+
+async def _new_epoch(r: redis.Redis) -> str:
+    await r.set(EPOCH_KEY, secrets.token_hex(4), nx=True)
+    return await r.get(EPOCH_KEY)
+
+
+async def get_tag(r: redis.Redis) -> str:
+    """Tag of the current list version, unique across Redis data losses."""
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.get(EPOCH_KEY)
+        pipe.get(VER_KEY)
+        epoch, ver = await pipe.execute()
+    return _tag(epoch or await _new_epoch(r), int(ver or 0))
+
+
+async def get_list_body(r: redis.Redis) -> Optional[Tuple[str, str, int]]:
+    """Return (tag, full charity list as a JSON array, revision), or None if not cached."""
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.get(READY_KEY)
+        pipe.get(EPOCH_KEY)
+        pipe.get(VER_KEY)
+        pipe.hvals(ENTRIES_KEY)
+        revision, epoch, ver, values = await pipe.execute()
+    if revision is None or epoch is None:
+        return None
+    return _tag(epoch, int(ver or 0)), "[" + ",".join(values) + "]", int(revision)
+
+
+async def list_body(r: redis.Redis) -> Tuple[str, str]:
+    """(tag, full list as a JSON array); see list_with_revision."""
+    tag, body, _ = await list_with_revision(r)
+    return tag, body
+
+
+async def list_with_revision(r: redis.Redis) -> Tuple[str, str, int]:
+    """
+    (tag, full list as a JSON array, revision) from the cache, rebuilding
+    it on a miss. The tag is the epoch and list version, or a
+    database-derived one while Redis is unavailable. Every change up to
+    `revision` is in the list, so clients pass it as `since`.
+    """
+    try:
+        cached = await get_list_body(r)
+        if cached is not None:
+            metrics.cache_hit("charity_list")
+            return cached
+        metrics.cache_miss("charity_list")
+        return await rebuild(r)
+    except RedisError:
+        return await local_list_body()
+
+
+async def get_entry(r: redis.Redis, id: int) -> Optional[str]:
+    return await r.hget(ENTRIES_KEY, str(id))
+
+
+async def fill_list(r: redis.Redis, charities: Sequence[Charity], ver: int) -> str:
+    """
+    Store a full rebuild read at version `ver`. The write is dropped if any
+    charity changed since, so a slow rebuild cannot overwrite newer entries.
+    """
+    entries = {str(c.id): encode_entry(c) for c in charities}
+    revision = max((c.revision for c in charities), default=0)
+    async with r.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(VER_KEY)
+            current = await pipe.get(VER_KEY)
+            if (int(current) if current is not None else 0) == ver:
+                pipe.multi()
+                pipe.delete(ENTRIES_KEY)
+                if entries:
+                    pipe.hset(ENTRIES_KEY, mapping=entries)
+                    pipe.expire(ENTRIES_KEY, ENTRIES_TTL)
+                pipe.setex(READY_KEY, ENTRIES_TTL, revision)
+                await pipe.execute()
+        except WatchError:
+            pass
+    return "[" + ",".join(entries.values()) + "]"
+
+
+async def fill_entry(r: redis.Redis, charity: Charity, ver: int) -> str:
+    entry = encode_entry(charity)
+    async with r.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(VER_KEY)
+            current = await pipe.get(VER_KEY)
+            if (int(current) if current is not None else 0) == ver:
+                pipe.multi()
+                pipe.hset(ENTRIES_KEY, str(charity.id), entry)
+                await pipe.execute()
+        except WatchError:
+            pass
+    return entry
+
+
+async def put_entry(r: redis.Redis, charity: Charity) -> Optional[int]:
+    """
+    Write one created or edited charity into the list cache and the change
+    feed. O(1). Returns the new list version, or None if Redis is down.
+    """
+    return await put_entries(r, [charity])
+
+
+async def put_entries(r: redis.Redis, charities: Sequence[Charity]) -> Optional[int]:
+    """
+    put_entry for a batch, in one script: touches only these charities'
+    fields and bumps the version once. Entries older than the cached one
+    are skipped, since the advisory lock that orders revisions is released
+    at commit, before this runs.
+    """
+    if not charities:
+        return None
+    args = [changes.STREAM_MAXLEN]
+    for c in charities:
+        args += [c.id, c.revision, encode_entry(c)]
+    try:
+        script = r.register_script(_PUT_ENTRIES_LUA)
+        ver, ready = await script(
+            keys=[ENTRIES_KEY, VER_KEY, READY_KEY, changes.STREAM_KEY, DELETED_KEY], args=args
+        )
+    except RedisError as e:
+        _write_missed(e)
+        return None
+    if not ready:
+        _schedule_rebuild(r)
+    return ver
+
+
+async def drop_entry(r: redis.Redis, id: int) -> Optional[int]:
+    """Remove one deleted charity from the list cache and publish it to the change feed. O(1)."""
+    return await drop_entries(r, [id])
+
+
+async def drop_entries(r: redis.Redis, ids: List[int]) -> Optional[int]:
+    """drop_entry for a batch, in one MULTI."""
+    if not ids:
+        return None
+    try:
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.hdel(ENTRIES_KEY, *(str(id) for id in ids))
+            pipe.sadd(DELETED_KEY, *(str(id) for id in ids))
+            pipe.expire(DELETED_KEY, ENTRIES_TTL)
+            pipe.incr(VER_KEY)
+            pipe.exists(READY_KEY)
+            for id in ids:
+                changes.add(pipe, "delete", id)
+            _, _, _, ver, ready, *_ = await pipe.execute()
+    except RedisError as e:
+        _write_missed(e)
+        return None
+    if not ready:
+        _schedule_rebuild(r)
+    return ver
+
+
+def _write_missed(e: Exception) -> None:
+    global _missed_write, _local_list
+    _missed_write = True
+    _local_list = None
+    logger.warning("charity list cache write failed, rebuilding once Redis is back: %r", e)
+
+
+async def rebuild(r: redis.Redis) -> Tuple[str, str, int]:
+    """
+    Rebuild the list cache from the database and return the tag of the
+    version it was read at, the list body and its revision.
+    Concurrent callers in this worker share a single rebuild. Rebuilds read
+    the primary, since a lagging replica could store a stale entry that no
+    later write would correct.
+    """
+    global _rebuild_task
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.create_task(_rebuild(r))
+    return await asyncio.shield(_rebuild_task)
+
+
+async def _rebuild(r: redis.Redis) -> Tuple[str, str, int]:
+    # The epoch is read first: if Redis loses its data in between, the tag
+    # carries the lost epoch, which is never issued again.
+    epoch = await r.get(EPOCH_KEY) or await _new_epoch(r)
+    ver = await get_ver(r)
+    async with SessionLocal() as db:
+        results = await db.execute(select(Charity))
+        items = results.scalars().all()
+    body = await fill_list(r, items, ver)
+    return _tag(epoch, ver), body, max((c.revision for c in items), default=0)
+
+
+def _schedule_rebuild(r: redis.Redis) -> None:
+    if _rebuild_task is None or _rebuild_task.done():
+        task = asyncio.create_task(rebuild(r))
+        task.add_done_callback(_log_failure)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("charity list cache rebuild failed: %r", task.exception())
+
+
+async def warm_forever(r: redis.Redis) -> None:
+    """Background loop run from the lifespan: rebuild the list before it expires."""
+    global _missed_write
+    while True:
+        try:
+            if _missed_write:
+                await rebuild(r)
+                # Dashboards missed the delta too; have them refetch.
+                async with r.pipeline(transaction=False) as pipe:
+                    changes.add(pipe, "reset", 0)
+                    await pipe.execute()
+                _missed_write = False
+            ttl = await r.ttl(READY_KEY)
+            if ttl < WARM_MARGIN and await r.set(WARM_LOCK_KEY, 1, nx=True, ex=WARM_INTERVAL):
+                await rebuild(r)
+        except Exception as e:
+            logger.warning("charity list cache warm failed: %r", e)
+        await asyncio.sleep(WARM_INTERVAL)
+
+
+async def local_list_body() -> Tuple[str, str, int]:
+    """
+    (tag, full list as a JSON array, revision) read from the database, for
+    when Redis is unavailable. The tag changes with every write: the highest revision
+    rises on inserts and edits, the count drops on deletes.
+    """
+    global _local_list, _local_task
+    if _local_list is not None and _local_list[0] > time.monotonic():
+        metrics.cache_hit("charity_list_local")
+        return _local_list[1:]
+    metrics.cache_miss("charity_list_local")
+    if _local_task is None or _local_task.done():
+        _local_task = asyncio.create_task(_read_local_list())
+    return await asyncio.shield(_local_task)
+
+
+async def _read_local_list() -> Tuple[str, str, int]:
+    global _local_list
+    async with ReadSessionLocal() as db:
+        items = (await db.execute(select(Charity))).scalars().all()
+    revision = max((c.revision for c in items), default=0)
+    tag = f"d{revision}-{len(items)}"
+    body = "[" + ",".join(encode_entry(c) for c in items) + "]"
+    _local_list = (time.monotonic() + LOCAL_TTL, tag, body, revision)
+    return tag, body, revision
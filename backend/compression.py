@@ -0,0 +1,215 @@
+# compression.py
+"""
+Response compression with brotli, zstd or gzip, whichever the client
+prefers among those installed (brotli and zstandard are optional).
+
+Buffered responses that carry an ETag are compressed once per
+(path, ETag, encoding) and served from an in-process cache afterwards;
+/charities tags its body with the list cache version, so the full list
+is compressed once per version rather than on every request.
+"""
+import gzip
+import zlib
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import metrics
+from profiling import span
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+
+# Content types that are already compressed; recompressing wastes CPU.
+SKIP_TYPES = (
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif",
+    "font/woff", "font/woff2", "application/zip", "application/gzip",
+    "application/x-brotli", "application/zstd", "application/octet-stream",
+    "audio/", "video/", "text/event-stream",
+)
+
+SUPPORTED = tuple(
+    enc for enc, available in (("br", brotli), ("zstd", zstandard), ("gzip", True)) if available
+)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding allowed by an Accept-Encoding header."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for enc in SUPPORTED:
+        q = offered.get(enc, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _stream_compressor(encoding: str) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    if encoding == "br":
+        c = brotli.Compressor(quality=5)
+        return c.process, c.finish
+    if encoding == "zstd":
+        c = zstandard.ZstdCompressor(level=6).compressobj()
+        return c.compress, c.flush
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return c.compress, c.flush
+
+
+class _LRU:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._data[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 500, cache_bytes: int = 16 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = _LRU(cache_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await _CompressedResponder(self, scope, encoding, send).run(receive)
+
+
+class _CompressedResponder:
+    def __init__(self, mw: CompressionMiddleware, scope, encoding: str, send):
+        self.mw = mw
+        self.scope = scope
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.passthrough = False
+        self.compressor = None
+        self.chunks = []
+        self.buffered = 0
+
+    async def run(self, receive):
+        await self.mw.app(self.scope, receive, self.on_send)
+
+    def _skip(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return True
+        content_type = headers.get("content-type", "")
+        return any(content_type.startswith(t) for t in SKIP_TYPES)
+
+    async def on_send(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            self.start = message
+            self.passthrough = self._skip(Headers(raw=message["headers"]))
+            if self.passthrough:
+                await self.send(message)
+            return
+        if kind != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+
+        if self.compressor is not None:
+            await self._send_stream_chunk(body, more)
+            return
+        self.chunks.append(body)
+        self.buffered += len(body)
+        if more:
+            # Streaming response: once there is enough to be worth it,
+            # compress on the fly. Streamed bodies are never cached.
+            if self.buffered >= self.mw.minimum_size:
+                await self._begin_stream()
+            return
+        await self._send_whole(b"".join(self.chunks))
+
+    async def _send_whole(self, body: bytes):
+        headers = MutableHeaders(raw=self.start["headers"])
+        if len(body) < self.mw.minimum_size or self.start["status"] < 200 or self.start["status"] == 204:
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        etag = headers.get("etag")
+        key = (self.scope["path"], self.scope["query_string"], etag, self.encoding) if etag else None
+        compressed = self.mw.cache.get(key) if key else None
+        if compressed is None:
+            with span("serialize", self.encoding):
+                compressed = compress(body, self.encoding)
+            if key:
+                metrics.cache_miss("compressed")
+                self.mw.cache.put(key, compressed)
+        else:
+            metrics.cache_hit("compressed")
+
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": compressed})
+
+    async def _begin_stream(self):
+        headers = MutableHeaders(raw=self.start["headers"])
+        del headers["content-length"]
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(self.start)
+        self.compressor = _stream_compressor(self.encoding)
+        pending, self.chunks = b"".join(self.chunks), []
+        await self._send_stream_chunk(pending, True)
+
+    async def _send_stream_chunk(self, body: bytes, more: bool):
+        process, finish = self.compressor
+        out = process(body) if body else b""
+        if not more:
+            out += finish()
+        if out or not more:
+            await self.send({"type": "http.response.body", "body": out, "more_body": more})
@@ -0,0 +1,93 @@
+# delta.py
+"""
+Delta sync for clients that already hold the charity catalog.
+
+Every insert and update of a charity draws the next charity_revision_seq
+value, and every delete leaves a tombstone that draws one too. A client
+asks GET /charities?since=<revision> for what changed after a revision it
+was given: the X-Revision header of the full list, or the "revision" of
+the previous delta. Nothing else is a valid `since`, in particular not
+the highest revision among the charities it holds: the cached list is
+updated after commit, so it can hold revision N+1 before N arrives.
+
+Writers take a transaction-level advisory lock before drawing a revision,
+so revisions become visible in order: a reader that sees revision N+1
+can never later find N committing behind it.
+
+Tombstones older than TOMBSTONE_RETENTION_DAYS are purged as later
+deletes commit. A `since` older than the newest purged tombstone gets
+410 Gone, and the client refetches the full list.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select, text
+
+from models.dbmodels import Charity, CharitySyncState, CharityTombstone
+from models.outmodels import CharityChanges, CharityRead
+
+
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+REVISION_LOCK_KEY = 72_510_002
+
+# For databases created before revisions existed; create_all only adds
+# missing tables, not columns.
+MIGRATIONS = (
+    "CREATE SEQUENCE IF NOT EXISTS charity_revision_seq",
+    "ALTER TABLE charity ADD COLUMN IF NOT EXISTS revision BIGINT NOT NULL DEFAULT nextval('charity_revision_seq')",
+    "CREATE INDEX IF NOT EXISTS ix_charity_revision ON charity (revision)",
+)
+
+
+async def lock_revisions(db: AsyncSession) -> None:
+    """Call before the first change of a write transaction; released on commit."""
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": REVISION_LOCK_KEY})
+
+
+async def record_delete(db: AsyncSession, id: int) -> None:
+    """Leave a tombstone for a deleted charity and purge expired ones, in the caller's transaction."""
+    await record_deletes(db, [id])
+
+
+async def record_deletes(db: AsyncSession, ids: List[int]) -> None:
+    db.add_all([CharityTombstone(id=id) for id in ids])
+    cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    purged = await db.execute(
+        delete(CharityTombstone)
+        .where(CharityTombstone.deleted_at < cutoff)
+        .returning(CharityTombstone.revision)
+    )
+    newest = max(purged.scalars().all(), default=None)
+    if newest is not None:
+        state = await db.get(CharitySyncState, 1) or CharitySyncState(id=1)
+        state.purged_revision = max(state.purged_revision, newest)
+        db.add(state)
+
+
+async def changes_since(db: AsyncSession, since: int) -> CharityChanges:
+    state = await db.get(CharitySyncState, 1)
+    if state is not None and since < state.purged_revision:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Revision is older than the tombstone retention window; refetch /charities.",
+        )
+
+    upserts = (await db.execute(
+        select(Charity).where(Charity.revision > since).order_by(Charity.revision)
+    )).scalars().all()
+    deleted = (await db.execute(
+        select(CharityTombstone.id, CharityTombstone.revision).where(CharityTombstone.revision > since)
+    )).all()
+
+    revision = max(
+        [since] + [c.revision for c in upserts] + [rev for _, rev in deleted]
+    )
+    return CharityChanges(
+        revision=revision,
+        upserts=[CharityRead.model_validate(c) for c in upserts],
+        deleted=[id for id, _ in deleted],
+    )
@@ -1,7 +1,7 @@
+import hmac
 import os
-from typing import AsyncGenerator, Annotated
-from sqlmodel import create_engine, Session
-from fastapi import Depends, Request, HTTPException
+from typing import AsyncGenerator, Annotated, Optional
+from fastapi import Depends, Header, Request, Response, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 import redis.asyncio as redis
 
@@ -14,18 +14,61 @@ DB_PASS = os.getenv("DB_PASS", "postgres")
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# Optional read replica for the charity GET routes. Without DB_READ_HOST
+# reads share the primary engine.
+DB_READ_HOST = os.getenv("DB_READ_HOST")
+DB_READ_PORT = int(os.getenv("DB_READ_PORT", str(DB_PORT)))
+READ_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_READ_HOST}:{DB_READ_PORT}/{DB_NAME}"
+
+# After a charity writes, its browser reads from the primary for this many
+# seconds so it sees its own edit despite replication lag.
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+PRIMARY_PIN_COOKIE = "pin_primary"
+
+# Shared secret for the /admin routes, sent as X-Admin-Token. Unset
+# disables them.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 engine = create_async_engine(DATABASE_URL, pool_pre_ping=True)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+read_engine = create_async_engine(READ_DATABASE_URL, pool_pre_ping=True) if DB_READ_HOST else engine
+ReadSessionLocal = async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with SessionLocal() as session:
         yield session
 
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    maker = SessionLocal if request.cookies.get(PRIMARY_PIN_COOKIE) else ReadSessionLocal
+    async with maker() as session:
+        yield session
+
+def is_primary(session: AsyncSession) -> bool:
+    """Whether `session` reads the primary, i.e. can't return replica-lagged rows."""
+    return session.bind is engine
+
+def pin_to_primary(response: Response) -> None:
+    """Route this client's reads to the primary for the read-your-writes window."""
+    response.set_cookie(
+        key=PRIMARY_PIN_COOKIE,
+        value="1",
+        httponly=True,
+        samesite="lax",
+        max_age=READ_YOUR_WRITES_SECONDS,
+        path="/",
+    )
+
 def get_redis(request: Request) -> redis.Redis:
     r = getattr(request.app.state, "redis", None)
     if r is None:
         raise HTTPException(500, "Redis not initialized")
     return r
 
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    if not (ADMIN_TOKEN and x_admin_token and hmac.compare_digest(x_admin_token, ADMIN_TOKEN)):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
 RedisDep = Annotated[redis.Redis, Depends(get_redis)]
\ No newline at end of file
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+import metrics
+import profiling
+from breaker import CircuitOpen, mapbox_breaker
+
+if TYPE_CHECKING:
+    import httpx
+
+
+MAPBOX_TOKEN = os.getenv("MAPBOX_API_TOKEN")
+# Overridable so benchmarks can point at bench/mapbox_stub.py.
+MAPBOX_API_URL = os.getenv("MAPBOX_API_URL", "https://api.mapbox.com").rstrip("/")
+MAPBOX_GEOCODE_URL = MAPBOX_API_URL + "/geocoding/v5/mapbox.places/{query}.json"
+MAPBOX_BATCH_GEOCODE_URL = MAPBOX_API_URL + "/search/geocode/v6/batch"
+BASE = MAPBOX_API_URL + "/search/searchbox/v1"
+
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+# Total time a Mapbox call may take, connect included, before the request
+# gives up with 504.
+MAPBOX_TIMEOUT = float(os.getenv("MAPBOX_TIMEOUT", "3"))
+MAPBOX_CONNECT_TIMEOUT = float(os.getenv("MAPBOX_CONNECT_TIMEOUT", "1"))
+# Cache misses are collected for up to GEOCODE_BATCH_WINDOW_MS and sent to
+# the batch geocoding endpoint together, at most GEOCODE_BATCH_MAX per call
+# (Mapbox accepts up to 1000). A lone miss goes to the single-address API.
+GEOCODE_BATCH_WINDOW = float(os.getenv("GEOCODE_BATCH_WINDOW_MS", "25")) / 1000
+GEOCODE_BATCH_MAX = int(os.getenv("GEOCODE_BATCH_MAX", "50"))
+
+# One client per worker so Mapbox calls reuse pooled keep-alive connections
+# instead of paying a TLS handshake each; closed from the lifespan. httpx is
+# imported with the first call, not at startup.
+_client: Optional["httpx.AsyncClient"] = None
+
+# Lookups currently talking to Mapbox, keyed by normalized address. Concurrent
+# callers for the same address await the same task instead of each making
+# their own upstream request.
+_inflight: dict[str, asyncio.Task] = {}
+
+# Misses waiting for the next batch, and the timer that sends it.
+_pending: list[tuple[str, asyncio.Future]] = []
+_flush_timer: Optional[asyncio.TimerHandle] = None
+_batches: set[asyncio.Task] = set()
+
+
+def normalize_address(address: str) -> str:
+    """Canonical form used to compare addresses and key the geocode cache."""
+    addr = address.strip().lower()
+    addr = re.sub(r"\s*,\s*", ", ", addr)
+    addr = re.sub(r"\s+", " ", addr)
+    return addr.strip(" ,.")
+
+
+def address_changed(old: str, new: str) -> bool:
+    return normalize_address(old) != normalize_address(new)
+
+
+async def geocode_address(address: str, r: redis.Redis) -> dict:
+    """
+    Resolve an address to a GeoJSON Feature, going to Mapbox only when the
+    normalized address is neither cached in Redis nor already being resolved.
+    """
+    if not address:
+        raise HTTPException(status_code=400, detail="Address is required")
+    norm = normalize_address(address)
+    key = f"geocode:{norm}"
+
+    try:
+        cached = await r.get(key)
+    except RedisError:
+        cached = None  # geocode without the cache while Redis is down
+    if cached:
+        metrics.cache_hit("geocode")
+        return json.loads(cached)
+    metrics.cache_miss("geocode")
+
+    task = _inflight.get(norm)
+    if task is None:
+        task = asyncio.create_task(_lookup_and_cache(address, key, r))
+        _inflight[norm] = task
+        task.add_done_callback(lambda _: _inflight.pop(norm, None))
+    return await asyncio.shield(task)
+
+
+async def _lookup_and_cache(address: str, key: str, r: redis.Redis) -> dict:
+    feature = await _batched_lookup(address)
+    try:
+        await r.setex(key, GEOCODE_CACHE_TTL, json.dumps(feature))
+    except RedisError:
+        pass
+    return feature
+
+
+async def _batched_lookup(address: str) -> dict:
+    global _flush_timer
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _pending.append((address, future))
+    if len(_pending) >= GEOCODE_BATCH_MAX:
+        _flush()
+    elif _flush_timer is None:
+        _flush_timer = loop.call_later(GEOCODE_BATCH_WINDOW, _flush)
+    return await future
+
+
+def _flush() -> None:
+    global _pending, _flush_timer
+    if _flush_timer is not None:
+        _flush_timer.cancel()
+        _flush_timer = None
+    batch, _pending = _pending, []
+    if batch:
+        task = asyncio.create_task(_send_batch(batch))
+        _batches.add(task)
+        task.add_done_callback(_batches.discard)
+
+
+async def _send_batch(batch: list[tuple[str, asyncio.Future]]) -> None:
+    try:
+        if len(batch) == 1:
+            features = [await _geocode_one(batch[0][0])]
+        else:
+            features = await _geocode_many([address for address, _ in batch])
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    for (_, future), feature in zip(batch, features):
+        if future.done():
+            continue
+        if feature is None:
+            future.set_exception(HTTPException(status_code=400, detail="Address not found"))
+        else:
+            future.set_result(feature)
+
+
+def http_client() -> "httpx.AsyncClient":
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(MAPBOX_TIMEOUT, connect=MAPBOX_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def mapbox_get(endpoint: str, url: str, params: dict) -> "httpx.Response":
+    """
+    GET a Mapbox API, recording latency and failures under `endpoint`.
+    Calls are cut off after MAPBOX_TIMEOUT (504) and fail fast with 503
+    while the Mapbox circuit is open.
+    """
+    return await _mapbox_call(endpoint, "GET", url, params)
+
+
+async def mapbox_post(endpoint: str, url: str, params: dict, body: list) -> "httpx.Response":
+    """POST `body` as JSON to a Mapbox API; see mapbox_get."""
+    return await _mapbox_call(endpoint, "POST", url, params, body)
+
+
+async def _mapbox_call(endpoint: str, method: str, url: str, params: dict, body: Optional[list] = None) -> "httpx.Response":
+    try:
+        mapbox_breaker.acquire()
+    except CircuitOpen as e:
+        metrics.mapbox_errors.inc(endpoint, "circuit_open")
+        raise HTTPException(
+            status_code=503,
+            detail="Address lookup is temporarily unavailable",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        ) from e
+
+    import httpx
+
+    start = time.perf_counter()
+    try:
+        resp = await asyncio.wait_for(http_client().request(method, url, params=params, json=body), MAPBOX_TIMEOUT)
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        metrics.mapbox_errors.inc(endpoint, type(e).__name__)
+        mapbox_breaker.failure()
+        if isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError)):
+            raise HTTPException(status_code=504, detail="Address lookup timed out") from e
+        raise HTTPException(status_code=502, detail="Address lookup failed") from e
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.mapbox_latency.observe(elapsed, endpoint)
+        profiling.record("upstream", endpoint, start, elapsed)
+    if resp.status_code >= 400:
+        metrics.mapbox_errors.inc(endpoint, str(resp.status_code))
+    if resp.status_code >= 500 or resp.status_code == 429:
+        mapbox_breaker.failure()
+    else:
+        mapbox_breaker.success()
+    return resp
+
+
+def _raise_for_status(resp: "httpx.Response") -> None:
+    import httpx
+    try:
+        resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"Geocoding failed: {e.response.text}") from e
+
+
+async def _geocode_one(address: str) -> Optional[dict]:
+    url = MAPBOX_GEOCODE_URL.format(query=quote(address))
+    params = {
+        "access_token": MAPBOX_TOKEN,
+        "limit": 1,
+        "autocomplete": "false",
+    }
+    resp = await mapbox_get("geocode", url, params)
+    _raise_for_status(resp)
+
+    features = resp.json().get("features") or []
+    if not features:
+        return None
+    feat = features[0]
+    return _feature(feat["geometry"], feat.get("place_name"))
+
+
+async def _geocode_many(addresses: list[str]) -> list[Optional[dict]]:
+    """One batch geocoding call; None for each address Mapbox couldn't place."""
+    body = [{"q": address, "limit": 1, "autocomplete": False} for address in addresses]
+    resp = await mapbox_post("geocode_batch", MAPBOX_BATCH_GEOCODE_URL, {"access_token": MAPBOX_TOKEN}, body)
+    _raise_for_status(resp)
+
+    results = resp.json().get("batch") or []
+    if len(results) != len(addresses):
+        raise HTTPException(status_code=502, detail="Geocoding failed: malformed batch response")
+    features = []
+    for result in results:
+        found = result.get("features") or []
+        if found:
+            feat = found[0]
+            features.append(_feature(feat["geometry"], (feat.get("properties") or {}).get("full_address")))
+        else:
+            features.append(None)
+    return features
+
+
+def _feature(geometry: dict, place_name: Optional[str]) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": geometry,
+        "properties": {
+            "place_name": place_name,
+            "source": "mapbox",
+        },
+    }
@@ -0,0 +1,189 @@
+# logs.py
+"""
+Logging that never writes from the event loop.
+
+setup() (called from the lifespan, so it runs in each worker after any
+fork) puts a QueueHandler on the root logger and starts a QueueListener
+thread that does the formatting and the actual writes. The queue is
+unbounded, so logging from a request costs a record and a put.
+
+Records are JSON lines (LOG_FORMAT=text for plain lines) carrying the
+request id of the request that logged them, plus any `fields` passed as
+`extra={"fields": {...}}`.
+
+AccessLogMiddleware gives each request an id (X-Request-ID, taken from
+the request or generated) and logs one record per request with route,
+status, duration and the cache outcomes metrics.cache_hit/cache_miss saw.
+At our request rate those are sampled: LOG_SAMPLE_RATE of ordinary
+requests are logged, and every 5xx and every request slower than
+LOG_SLOW_MS. It replaces uvicorn's access log, which writes to stderr
+from the event loop on every request.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", "1000"))
+
+access_logger = logging.getLogger("access")
+
+# Per-request fields: request_id, and cache outcomes as they happen.
+_request: ContextVar[Optional[dict]] = ContextVar("request_log", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def request_id() -> Optional[str]:
+    ctx = _request.get()
+    return ctx["request_id"] if ctx is not None else None
+
+
+def note_cache(family: str, outcome: str) -> None:
+    ctx = _request.get()
+    if ctx is not None:
+        ctx.setdefault("cache", {})[family] = outcome
+
+
+class _RequestIdFilter(logging.Filter):
+    # Runs in the logging thread's caller, where the request context is set;
+    # the listener thread formats the record later without it.
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup() -> None:
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(q)
+    handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn/gunicorn install their own stream handlers; send their records
+    # through the queue too, and drop the per-request access log.
+    for name in ("uvicorn", "uvicorn.error", "gunicorn.error"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+    for name in ("uvicorn.access", "gunicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = False
+
+    _listener = logging.handlers.QueueListener(q, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown() -> None:
+    """Flush what's queued and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def is_event_stream(message: dict) -> bool:
+    """Whether an http.response.start message opens a Server-Sent Events stream."""
+    for key, value in message.get("headers", ()):
+        if key.lower() == b"content-type":
+            return value.startswith(b"text/event-stream")
+    return False
+
+
+class AccessLogMiddleware:
+    """
+    Pure ASGI middleware: request ids plus the sampled access log. Event
+    streams last as long as the client stays connected, so their duration
+    never counts as slow.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                rid = value.decode("latin-1")[:64]
+                break
+        ctx = {"request_id": rid or uuid.uuid4().hex}
+        token = _request.set(ctx)
+        status_code = 500
+        stream = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, stream
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                stream = is_event_stream(message)
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", ctx["request_id"].encode("latin-1"))]}
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if status_code >= 500:
+                level = logging.ERROR
+            elif elapsed_ms >= LOG_SLOW_MS and not stream:
+                level = logging.WARNING
+            elif LOG_SAMPLE_RATE and random.random() < LOG_SAMPLE_RATE:
+                level = logging.INFO
+            else:
+                level = None
+            if level is not None and access_logger.isEnabledFor(level):
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                fields = {
+                    "method": scope["method"],
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round(elapsed_ms, 2),
+                }
+                if "cache" in ctx:
+                    fields["cache"] = ctx["cache"]
+                if level == logging.INFO:
+                    fields["sample_rate"] = LOG_SAMPLE_RATE
+                access_logger.log(level, "%s %s %d", scope["method"], route, status_code, extra={"fields": fields})
+            _request.reset(token)
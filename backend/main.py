@@ -1,33 +1,64 @@
+import asyncio
+import math
 from contextlib import asynccontextmanager
 import os
 from pathlib import Path
 import redis.asyncio as redis
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from sqlmodel import SQLModel, select 
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from redis.exceptions import RedisError
+from sqlmodel import SQLModel, select, text
 from sqlalchemy.ext.asyncio import AsyncEngine
-from deps import engine, SessionDep
-from routes import routes
+
+# Local development: fill unset settings from a .env in backend/ or the repo
+# root before any module reads them. Deployments set the environment
+# directly and never import dotenv.
+_dotenv = next((d / ".env" for d in (Path(__file__).parent, Path(__file__).parent.parent) if (d / ".env").exists()), None)
+if _dotenv is not None:
+    from dotenv import load_dotenv
+    load_dotenv(_dotenv)
+
+from deps import engine, read_engine, SessionDep
+from routes import routes, health, admin
 from deps import RedisDep
 from rate_limit import RateLimitMiddleware
+from compression import CompressionMiddleware
+from admission import AdmissionMiddleware
+import logs
+import metrics
+import profiling
+import breaker
+import charity_cache
+import geocode
+import changes
+import delta
+import moderation
+import zipindex
 from models.dbmodels import Charity
 from sqlalchemy.ext.asyncio import AsyncSession
-import bcrypt
 
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB   = int(os.getenv("REDIS_DB", "0"))
+# Seconds a Redis command may take before it counts as a failure toward
+# the Redis circuit breaker.
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "1"))
 
 def hash_password(password: str) -> str:
+    import bcrypt  # only needed to seed an empty database
     return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+# Key for the advisory lock that serializes schema creation and seeding
+# when several workers start at once.
+STARTUP_LOCK_KEY = 72_510_001
+
+async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        for statement in delta.MIGRATIONS + moderation.MIGRATIONS:
+            await conn.execute(text(statement))
     async with AsyncSession(engine) as session:
         result = await session.execute(select(Charity))
         existing = result.scalars().all()
@@ -560,25 +591,62 @@ async def lifespan(app: FastAPI):
             session.add_all(charities)
             await session.commit()
 
-    app.state.redis = redis.Redis(
-        host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logs.setup()
+    async with engine.connect() as lock_conn:
+        await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+        try:
+            await init_db()
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY})
+
+    app.state.redis = breaker.GuardedRedis(
+        host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True,
+        socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT,
     )
 
+    # Have the list cache built before the first request, and keep it warm.
+    try:
+        await charity_cache.rebuild(app.state.redis)
+    except Exception as e:
+        charity_cache.logger.warning("initial charity list cache warm failed: %r", e)
+    warmer = asyncio.create_task(charity_cache.warm_forever(app.state.redis))
+    # The change feed blocks in XREAD for seconds at a time, so it gets its
+    # own client without the command timeout.
+    feed_redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+    app.state.changes = changes.broadcaster(feed_redis)
+    zipindex.load()
+
     try:
         yield
     finally:
+        warmer.cancel()
+        await app.state.changes.close()
+        await feed_redis.aclose()
+        await geocode.close_http_client()
+        zipindex.close()
         r = getattr(app.state, "redis", None)
         if r is not None:
             await r.aclose()
         await engine.dispose()
+        if read_engine is not engine:
+            await read_engine.dispose()
+        logs.shutdown()
+
 
 
 
 
 
+metrics.instrument_engine(engine)
+if read_engine is not engine:
+    metrics.instrument_engine(read_engine)
 
 app = FastAPI(lifespan=lifespan)
-app.add_middleware(GZipMiddleware, minimum_size=500)
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+# Inside CORS so shed responses still carry CORS headers.
+app.add_middleware(AdmissionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -586,24 +654,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Revision"],
 )
 app.add_middleware(
     RateLimitMiddleware,
-    limit=10,
+    limit=int(os.getenv("LOGIN_RATE_LIMIT", "10")),
     window=60,
     paths=["/charities/login"],  
 )
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(logs.AccessLogMiddleware)
 
 # Include API routes first (before static files)
 app.include_router(routes.router, tags=["notes"])
+app.include_router(health.router, tags=["health"])
+app.include_router(admin.router, tags=["admin"])
 
-@app.get("/health")
-async def health():
-    try:
-        pong = await app.state.redis.ping()
-        return {"db": "ok", "redis": pong}
-    except Exception as e:
-        return {"db": "ok", "redis": False, "error": str(e)}
+@app.exception_handler(RedisError)
+async def redis_unavailable(request, exc: RedisError):
+    # Routes with a fallback catch Redis errors themselves; the rest (login,
+    # sessions) cannot work without Redis and say so instead of a 500.
+    retry_after = getattr(exc, "retry_after", breaker.redis_breaker.reset_timeout)
+    return JSONResponse(
+        {"detail": "Service temporarily unavailable"},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Serve static files (JS, CSS, images, etc.) from the frontend build
 frontend_dist = Path(__file__).parent.parent / "frontend" / "dist"
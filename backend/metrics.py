@@ -0,0 +1,229 @@
+# metrics.py
+"""
+In-process metrics rendered in the Prometheus text format at /metrics.
+
+Each worker keeps its own counters; scrape every worker (or run with a
+single worker per container) to get the full picture.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import logs
+import profiling
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_fmt_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(_Metric):
+    """A gauge whose value is read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def samples(self) -> Iterable[str]:
+        yield f"{self.name} {self.fn()}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        row = self._values.get(labels)
+        if row is None:
+            row = self._values[labels] = [0] * (len(self.buckets) + 2)
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, row in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {cumulative}"
+            yield f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {row[-1]}"
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+http_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+cache_requests = Counter(
+    "cache_requests_total", "Cache lookups by key family and outcome.", ("family", "outcome")
+)
+redis_latency = Histogram(
+    "redis_command_duration_seconds", "Redis command latency.", ("command",)
+)
+redis_errors = Counter("redis_command_errors_total", "Redis commands that raised.", ("command",))
+db_latency = Histogram(
+    "db_statement_duration_seconds", "Postgres statement latency by statement verb.", ("verb",)
+)
+mapbox_latency = Histogram(
+    "mapbox_request_duration_seconds", "Mapbox request latency.", ("endpoint",)
+)
+mapbox_errors = Counter(
+    "mapbox_request_errors_total", "Mapbox requests that failed.", ("endpoint", "reason")
+)
+
+
+def cache_hit(family: str) -> None:
+    cache_requests.inc(family, "hit")
+    logs.note_cache(family, "hit")
+
+
+def cache_miss(family: str) -> None:
+    cache_requests.inc(family, "miss")
+    logs.note_cache(family, "miss")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route latency; labels use the route
+    template. Event streams stay open for as long as the client does, so
+    they aren't recorded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        stream = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, stream
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                stream = logs.is_event_stream(message)
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not stream:
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                http_latency.observe(time.perf_counter() - start, scope["method"], path, str(status_code))
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        command = "MULTI" if self.is_transaction else "PIPELINE"
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except Exception:
+            redis_errors.inc(command)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            redis_latency.observe(elapsed, command)
+            profiling.record("redis", command, start, elapsed)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that times every command and pipeline round trip."""
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            redis_errors.inc(command)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            redis_latency.observe(elapsed, command)
+            profiling.record("redis", command, start, elapsed)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Time every statement executed through the engine's connections."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is None:
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+        elapsed = time.perf_counter() - start
+        db_latency.observe(elapsed, verb)
+        profiling.record("db", verb, start, elapsed)
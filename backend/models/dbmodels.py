@@ -1,7 +1,18 @@
+from datetime import datetime
 from typing import Optional, Dict, Any
+from sqlalchemy import BigInteger, DateTime, Index, Sequence, func
 from sqlmodel import SQLModel, Field, Column, Boolean, text, JSON  
 
+# Shared by charities and tombstones: every insert, update and delete takes
+# the next value, so "changed since N" is a range scan on either table.
+charity_revision_seq = Sequence("charity_revision_seq", metadata=SQLModel.metadata)
+
 class Charity(SQLModel, table=True):
+    # The moderation queue: only unapproved rows, in signup (id) order.
+    __table_args__ = (
+        Index("ix_charity_pending", "id", postgresql_where=text("is_approved = false")),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(min_length=3, max_length=30, unique=True, index=True)
     password: str = Field(min_length=6)
@@ -21,4 +32,38 @@ class Charity(SQLModel, table=True):
     )
     geojson: Dict[str, Any] = Field(
         sa_column=Column(JSON, nullable=False, comment="GeoJSON Feature(Point), derived from address")
-    )
\ No newline at end of file
+    )
+    revision: Optional[int] = Field(
+        default=None,
+        sa_column=Column(
+            BigInteger,
+            charity_revision_seq,
+            nullable=False,
+            index=True,
+            server_default=charity_revision_seq.next_value(),
+            onupdate=charity_revision_seq.next_value(),
+        ),
+    )
+
+class CharityTombstone(SQLModel, table=True):
+    """A deleted charity, kept for delta sync until TOMBSTONE_RETENTION_DAYS pass."""
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    revision: Optional[int] = Field(
+        default=None,
+        sa_column=Column(
+            BigInteger,
+            charity_revision_seq,
+            nullable=False,
+            index=True,
+            server_default=charity_revision_seq.next_value(),
+        ),
+    )
+    deleted_at: Optional[datetime] = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True, server_default=func.now()),
+    )
+
+class CharitySyncState(SQLModel, table=True):
+    """Single row: the newest revision whose tombstone has been purged."""
+    id: int = Field(default=1, primary_key=True)
+    purged_revision: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
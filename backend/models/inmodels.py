@@ -1,3 +1,4 @@
+from typing import List, Optional
 from sqlmodel import SQLModel, Field, Column, Boolean, text
 
 class CharityCreate(SQLModel):
@@ -15,6 +16,7 @@ class CharityLogin(SQLModel):
 
 class CharityEdit(SQLModel): 
     name: str = Field(min_length=1)
+    address: Optional[str] = Field(default=None, min_length=5)
     description: str = Field(default="")
     website: str = Field(default="")
     contact: str = Field(min_length=5)
@@ -23,4 +25,7 @@ class CharityEdit(SQLModel):
     )
     needs_donations: bool = Field(
         sa_column=Column(Boolean, nullable=False, server_default=text("false"))
-    )
\ No newline at end of file
+    )
+
+class CharityIds(SQLModel):
+    ids: List[int] = Field(min_length=1, max_length=1000)
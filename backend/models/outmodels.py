@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from sqlmodel import SQLModel, Field
 
 class CharityRead(SQLModel):
@@ -12,4 +12,15 @@ class CharityRead(SQLModel):
     needs_volunteers: bool
     needs_donations: bool
     is_approved: bool
-    geojson: Dict[str, Any]
\ No newline at end of file
+    geojson: Dict[str, Any]
+    revision: int
+
+class CharityChanges(SQLModel):
+    revision: int
+    upserts: List[CharityRead]
+    deleted: List[int]
+
+class PendingCharities(SQLModel):
+    items: List[CharityRead]
+    # Pass as `after` for the next page; None on the last page.
+    next_after: Optional[int]
@@ -0,0 +1,71 @@
+# moderation.py
+"""
+Approval queue for new charities.
+
+Pending charities are found through ix_charity_pending, a partial index
+holding only rows with is_approved = false, so listing the queue never
+scans approved charities however many there are. Pages are keyset-based
+(id > after), which stays fast deep into a large signup wave where
+OFFSET would not.
+
+Approving and rejecting are one statement each for the whole batch.
+Approving is an UPDATE, so each approved row draws a new revision
+through the column's onupdate. Rejecting deletes the rows and leaves
+tombstones, so delta sync clients drop them too. Both only touch rows
+that are still pending and return the ones they changed.
+"""
+from typing import List, Sequence
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+import delta
+from models.dbmodels import Charity
+
+
+# create_all doesn't add indexes to an existing table.
+MIGRATIONS = (
+    "CREATE INDEX IF NOT EXISTS ix_charity_pending ON charity (id) WHERE is_approved = false",
+)
+
+
+async def pending(db: AsyncSession, after: int, limit: int) -> Sequence[Charity]:
+    result = await db.execute(
+        select(Charity)
+        .where(Charity.is_approved == False, Charity.id > after)  # noqa: E712 (matches the index predicate)
+        .order_by(Charity.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def approve(db: AsyncSession, ids: List[int]) -> Sequence[Charity]:
+    """Approve the pending charities among `ids`; returns them with their new revisions."""
+    await delta.lock_revisions(db)
+    result = await db.execute(
+        update(Charity)
+        .where(Charity.id.in_(ids), Charity.is_approved == False)  # noqa: E712
+        .values(is_approved=True)
+        .returning(Charity)
+        .execution_options(synchronize_session=False)
+    )
+    approved = result.scalars().all()
+    await db.commit()
+    return approved
+
+
+async def reject(db: AsyncSession, ids: List[int]) -> List[int]:
+    """Delete the pending charities among `ids`; returns their ids."""
+    await delta.lock_revisions(db)
+    result = await db.execute(
+        delete(Charity)
+        .where(Charity.id.in_(ids), Charity.is_approved == False)  # noqa: E712
+        .returning(Charity.id)
+        .execution_options(synchronize_session=False)
+    )
+    rejected = list(result.scalars().all())
+    if rejected:
+        await delta.record_deletes(db, rejected)
+    await db.commit()
+    return rejected
@@ -0,0 +1,51 @@
+# passwords.py
+"""
+bcrypt hashing off the event loop.
+
+bcrypt is deliberately slow (~250ms per call at the default cost), so calls
+run in worker threads behind a limiter sized to the CPU count. Requests
+beyond that wait in the limiter's queue instead of blocking the loop.
+"""
+import os
+
+import anyio
+
+from metrics import Gauge
+from profiling import span
+
+
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+
+_limiter = anyio.CapacityLimiter(BCRYPT_WORKERS)
+
+
+def queue_depth() -> int:
+    return _limiter.statistics().tasks_waiting
+
+
+def in_flight() -> int:
+    return _limiter.borrowed_tokens
+
+
+Gauge("bcrypt_queue_depth", "bcrypt calls waiting for a worker thread.", queue_depth)
+Gauge("bcrypt_in_flight", "bcrypt calls currently running.", in_flight)
+
+
+def _hash(password: str) -> str:
+    import bcrypt  # loaded with the first login or registration, not at startup
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def _verify(plain: str, hashed: str) -> bool:
+    import bcrypt
+    return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+
+
+async def hash_password(password: str) -> str:
+    with span("hash", "bcrypt"):
+        return await anyio.to_thread.run_sync(_hash, password, limiter=_limiter)
+
+
+async def verify_password(plain: str, hashed: str) -> bool:
+    with span("hash", "bcrypt"):
+        return await anyio.to_thread.run_sync(_verify, plain, hashed, limiter=_limiter)
@@ -0,0 +1,216 @@
+# profiling.py
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` or is
+picked by PROFILE_SAMPLE_RATE. While profiled, the existing timing hooks
+(metrics.py for Redis and Postgres, geocode.mapbox_get, passwords, wire,
+compression) also record spans on it:
+
+    db  redis  upstream  hash  serialize
+
+Profiled requests get a Server-Timing header with the per-kind totals, so
+the browser's network panel shows the breakdown, and the ones slower than
+PROFILE_SLOW_MS are logged with their span timeline.
+
+With a valid token, `X-Profile-Dump: pyinstrument` or `cprofile` also
+writes a profile of the request to PROFILE_DIR and names the file in the
+X-Profile-Dump response header. pyinstrument follows only this request's
+task; cProfile sees everything the worker thread runs meanwhile, so use
+it on an otherwise idle worker.
+
+Unprofiled requests pay one context variable lookup per hook.
+"""
+import hmac
+import logging
+import os
+import random
+import tempfile
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # optional
+    Profiler = None
+
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", Path(tempfile.gettempdir()) / "charity-profiles"))
+# Spans kept per request for the slow log; totals count every span.
+MAX_SPANS = 200
+
+logger = logging.getLogger(__name__)
+
+
+class Profile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.totals: Dict[str, List[float]] = {}  # kind -> [seconds, count]
+        self.spans: List[Tuple[float, float, int, str, str]] = []  # offset, seconds, depth, kind, name
+        self.depth = 0
+        self.dropped = 0
+
+    def add(self, kind: str, name: str, start: float, seconds: float, depth: int) -> None:
+        total = self.totals.setdefault(kind, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append((start - self.start, seconds, depth, kind, name))
+        else:
+            self.dropped += 1
+
+    def server_timing(self, elapsed: float) -> str:
+        parts = [f'{kind};dur={s * 1000:.1f};desc="{n} calls"' for kind, (s, n) in self.totals.items()]
+        parts.append(f"total;dur={elapsed * 1000:.1f}")
+        return ", ".join(parts)
+
+    def render(self) -> str:
+        lines = [
+            f"{'  ' * (depth + 1)}+{offset * 1000:.1f}ms {kind} {name} {seconds * 1000:.1f}ms"
+            for offset, seconds, depth, kind, name in sorted(self.spans)
+        ]
+        if self.dropped:
+            lines.append(f"  ... {self.dropped} more spans")
+        return "\n".join(lines)
+
+
+_current: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+
+
+def record(kind: str, name: str, start: float, seconds: float) -> None:
+    """Add a span already timed by the caller (perf_counter start) to the current request's profile."""
+    profile = _current.get()
+    if profile is not None:
+        profile.add(kind, name, start, seconds, profile.depth)
+
+
+class _Span:
+    __slots__ = ("profile", "kind", "name", "start")
+
+    def __init__(self, profile: Profile, kind: str, name: str):
+        self.profile = profile
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.profile.depth += 1
+
+    def __exit__(self, *exc):
+        self.profile.depth -= 1
+        self.profile.add(self.kind, self.name, self.start, time.perf_counter() - self.start, self.profile.depth)
+
+
+class _NoSpan:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(kind: str, name: str):
+    """`with span("serialize", "msgpack"):` times the block when the request is profiled."""
+    profile = _current.get()
+    return _NO_SPAN if profile is None else _Span(profile, kind, name)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _authorized(scope) -> bool:
+    given = _header(scope, b"x-profile")
+    return bool(PROFILE_TOKEN and given and hmac.compare_digest(given, PROFILE_TOKEN))
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware; decides per request whether to profile and reports the result."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        authorized = _authorized(scope)
+        if not authorized and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+
+        profile = Profile()
+        token = _current.set(profile)
+        dump = _header(scope, b"x-profile-dump") if authorized else None
+        dump_path = _dump_path(scope, dump) if dump in ("pyinstrument", "cprofile") else None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and authorized:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing(time.perf_counter() - profile.start).encode()))
+                if dump_path is not None:
+                    headers.append((b"x-profile-dump", str(dump_path).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = _start_dump(dump) if dump_path is not None else None
+        if profiler is None:
+            dump_path = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                _finish_dump(profiler, dump_path)
+            _current.reset(token)
+            elapsed = time.perf_counter() - profile.start
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                route = getattr(scope.get("route"), "path", None) or scope["path"]
+                logger.warning(
+                    "slow request %s %s %.1fms [%s]\n%s",
+                    scope["method"], route, elapsed * 1000,
+                    ", ".join(f"{k} {s * 1000:.1f}ms/{n}" for k, (s, n) in profile.totals.items()),
+                    profile.render(),
+                )
+
+
+def _dump_path(scope, kind: str) -> Optional[Path]:
+    if kind == "pyinstrument" and Profiler is None:
+        return None
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    name = scope["path"].strip("/").replace("/", "_") or "root"
+    suffix = ".html" if kind == "pyinstrument" else ".prof"
+    return PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{name}-{os.getpid()}{suffix}"
+
+
+def _start_dump(kind: str):
+    if kind == "pyinstrument":
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        return profiler
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another request's cProfile dump is running
+        return None
+    return profiler
+
+
+def _finish_dump(profiler, path: Path) -> None:
+    if path.suffix == ".prof":
+        profiler.disable()
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path.write_text(profiler.output_html())
+    logger.info("wrote request profile %s", path)
@@ -1,5 +1,6 @@
 # rate_limit.py
 import time
+from redis.exceptions import RedisError
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 from starlette.requests import Request
@@ -8,6 +9,9 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     """
     Simple fixed-window rate limiter that fetches the Redis client
     from request.app.state.redis (set in your lifespan).
+
+    While Redis is unavailable it counts in this worker instead, so the
+    limit still holds per worker rather than failing the request.
     """
 
     def __init__(self, app, *, limit=10, window=60, key_fn=None, paths=None, redis_attr="redis"):
@@ -17,6 +21,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         self.key_fn = key_fn or (lambda req: req.client.host)
         self.paths = set(paths or [])  
         self.redis_attr = redis_attr  
+        self._local = {}
 
     def _should_limit(self, request: Request) -> bool:
         return (not self.paths) or (request.url.path in self.paths)
@@ -25,20 +30,19 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         if not self._should_limit(request):
             return await call_next(request)
 
-        r = getattr(request.app.state, self.redis_attr, None)
-        if r is None:
-            return JSONResponse(
-                {"detail": "Rate limiter unavailable"},
-                status_code=503
-            )
-
         ident = self.key_fn(request)
         bucket = int(time.time()) // self.window
         key = f"rl:{request.url.path}:{ident}:{bucket}"
 
-        count = await r.incr(key)
-        if count == 1:
-            await r.expire(key, self.window)
+        r = getattr(request.app.state, self.redis_attr, None)
+        try:
+            if r is None:
+                raise RedisError("Redis not initialized")
+            count = await r.incr(key)
+            if count == 1:
+                await r.expire(key, self.window)
+        except RedisError:
+            count = self._count_locally(key, bucket)
 
         if count > self.limit:
             return JSONResponse(
@@ -48,3 +52,10 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             )
 
         return await call_next(request)
+
+    def _count_locally(self, key: str, bucket: int) -> int:
+        if len(self._local) > 10_000:
+            self._local = {k: v for k, v in self._local.items() if v[0] == bucket}
+        _, count = self._local.get(key, (bucket, 0))
+        self._local[key] = (bucket, count + 1)
+        return count + 1
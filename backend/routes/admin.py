@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, Query
+from redis.exceptions import RedisError
+
+from deps import SessionDep, RedisDep, require_admin
+from models.inmodels import CharityIds
+from models.outmodels import CharityRead, PendingCharities
+import charity_cache
+import moderation
+import sessions
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/charities/pending", response_model=PendingCharities)
+async def pending_charities(
+    db: SessionDep,
+    after: int = Query(default=0, ge=0),
+    limit: int = Query(default=50, ge=1, le=500),
+):
+    items = await moderation.pending(db, after, limit)
+    return PendingCharities(
+        items=[CharityRead.model_validate(c) for c in items],
+        next_after=items[-1].id if len(items) == limit else None,
+    )
+
+
+@router.post("/charities/approve")
+async def approve_charities(data: CharityIds, db: SessionDep, r: RedisDep):
+    approved = await moderation.approve(db, data.ids)
+    await charity_cache.put_entries(r, approved)
+    return {"approved": [c.id for c in approved]}
+
+
+@router.post("/charities/reject")
+async def reject_charities(data: CharityIds, db: SessionDep, r: RedisDep):
+    rejected = await moderation.reject(db, data.ids)
+    for id in rejected:
+        try:
+            await sessions.revoke_all(r, id)
+        except RedisError:
+            pass  # the charity is gone, so its sessions can no longer write anyway
+    await charity_cache.drop_entries(r, rejected)
+    return {"rejected": rejected}
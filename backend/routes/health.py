@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from deps import engine, read_engine
+import breaker
+
+
+# Probe results are reused for this long so frequent load balancer probes
+# do not turn into a steady stream of SELECT 1s and PINGs.
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "1.0"))
+DB_CHECK_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "1.0"))
+REDIS_CHECK_TIMEOUT = float(os.getenv("HEALTH_REDIS_TIMEOUT", "0.5"))
+# Readiness fails once acquiring a pooled connection takes longer than this,
+# so traffic is shed before the pool is fully exhausted.
+POOL_WAIT_THRESHOLD_MS = float(os.getenv("HEALTH_POOL_WAIT_THRESHOLD_MS", "250"))
+
+router = APIRouter()
+
+_last_report: Optional[dict] = None
+_last_checked = 0.0
+_lock = asyncio.Lock()
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+async def check_db(db_engine: AsyncEngine) -> dict:
+    start = time.perf_counter()
+    acquired = start
+
+    async def probe():
+        nonlocal acquired
+        async with db_engine.connect() as conn:
+            acquired = time.perf_counter()
+            await conn.execute(text("SELECT 1"))
+
+    pool = db_engine.pool
+    report = {
+        "pool_checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+    }
+    try:
+        await asyncio.wait_for(probe(), timeout=DB_CHECK_TIMEOUT)
+    except Exception as e:
+        report.update(ok=False, error=type(e).__name__, latency_ms=_ms(time.perf_counter() - start))
+        return report
+    pool_wait_ms = _ms(acquired - start)
+    report.update(
+        ok=pool_wait_ms <= POOL_WAIT_THRESHOLD_MS,
+        latency_ms=_ms(time.perf_counter() - start),
+        pool_wait_ms=pool_wait_ms,
+    )
+    return report
+
+
+async def check_redis(r) -> dict:
+    start = time.perf_counter()
+    if r is None:
+        return {"ok": False, "error": "not initialized"}
+    try:
+        await asyncio.wait_for(r.ping(), timeout=REDIS_CHECK_TIMEOUT)
+    except Exception as e:
+        return {"ok": False, "error": type(e).__name__, "latency_ms": _ms(time.perf_counter() - start)}
+    return {"ok": True, "latency_ms": _ms(time.perf_counter() - start)}
+
+
+async def dependency_report(request: Request) -> dict:
+    """Check Postgres and Redis, reusing a recent result when there is one."""
+    global _last_report, _last_checked
+    if _last_report is not None and time.monotonic() - _last_checked < HEALTH_CACHE_SECONDS:
+        return _last_report
+    async with _lock:
+        # Another probe may have refreshed the report while we waited.
+        if _last_report is not None and time.monotonic() - _last_checked < HEALTH_CACHE_SECONDS:
+            return _last_report
+        checks = [check_db(engine), check_redis(getattr(request.app.state, "redis", None))]
+        if read_engine is not engine:
+            checks.append(check_db(read_engine))
+        db, redis_, *replica = await asyncio.gather(*checks)
+        # Redis is reported but not part of readiness either: reads fall back
+        # to the database while it is down (see breaker.py).
+        redis_["circuit"] = breaker.STATE_NAMES[breaker.redis_breaker.state]
+        report = {
+            "ready": db["ok"],
+            "degraded": not redis_["ok"],
+            "db": db,
+            "redis": redis_,
+            "mapbox": {"circuit": breaker.STATE_NAMES[breaker.mapbox_breaker.state]},
+        }
+        if replica:
+            # Not part of readiness: a replica outage hits every worker alike,
+            # so pulling them out of rotation would not help.
+            report["db_read"] = replica[0]
+        _last_report = report
+        _last_checked = time.monotonic()
+        return _last_report
+
+
+@router.get("/health/live")
+async def liveness():
+    """The process is up and serving; never touches dependencies."""
+    return {"status": "ok"}
+
+
+@router.get("/health/ready")
+async def readiness(request: Request):
+    report = await dependency_report(request)
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@router.get("/health")
+async def health(request: Request):
+    return await dependency_report(request)
@@ -1,32 +1,32 @@
-from typing import Optional, Dict, Any
-from urllib.parse import quote
+from typing import Optional, Dict, Any, Union
 from pathlib import Path
 from fastapi import APIRouter, HTTPException, status, Response, Request, Query
-from fastapi.responses import RedirectResponse, FileResponse
+from fastapi.responses import RedirectResponse, FileResponse, StreamingResponse
 from sqlmodel import SQLModel, Field, select
-from deps import SessionDep, RedisDep
+from redis.exceptions import RedisError
+from deps import SessionDep, ReadSessionDep, RedisDep, is_primary, pin_to_primary
 from models.dbmodels import Charity
 from models.inmodels import CharityCreate, CharityEdit, CharityLogin
-from models.outmodels import CharityRead
-from fastapi.encoders import jsonable_encoder
-import json
-import bcrypt
+from models.outmodels import CharityChanges, CharityRead
 import uuid
-from dotenv import load_dotenv
-import os
-import httpx
-
-
-
-load_dotenv()
-MAPBOX_TOKEN = os.getenv("MAPBOX_API_TOKEN")  
-MAPBOX_GEOCODE_URL = "https://api.mapbox.com/geocoding/v5/mapbox.places/{query}.json"
-MAPBOX_RETRIEVE_URL = "https://api.mapbox.com/search/searchbox/v1/retrieve/{mapbox_id}"
-BASE = "https://api.mapbox.com/search/searchbox/v1"
+import zlib
+from geocode import MAPBOX_TOKEN, MAPBOX_GEOCODE_URL, BASE, address_changed, geocode_address
+from passwords import hash_password, verify_password
+import charity_cache
+import sessions
+import metrics
+import wire
+import changes
+import delta
+import typeahead
+import zipindex
+import snapshot
 
 
 router = APIRouter()
 
+REVISION_HEADER = "X-Revision"
+
 frontend_dist = Path(__file__).parent.parent / "frontend" / "dist"
 
 @router.get("/") 
@@ -34,24 +34,47 @@ def home():
     return {"status": "ok"}
 
 
-@router.get("/charities", response_model=list[CharityRead])
-async def charities(db: SessionDep, r: RedisDep):
-    ver = await _get_ver(r)  
-    key = f"charities:all:v{ver}"
-    cached = await r.get(key)
-    if cached:
-        print("cache used")
-        return json.loads(cached)
-
-    results = await db.execute(select(Charity))
-    items = results.scalars().all()
-    payload = jsonable_encoder(items)
-    await r.setex(key, 180, json.dumps(payload))
-    return payload
+@router.get(
+    "/charities",
+    # The full list, or with `since` only what changed after that revision.
+    response_model=Union[list[CharityRead], CharityChanges],
+    responses={
+        200: {"headers": {"X-Revision": {
+            "description": "Full list only: the revision to pass as `since` next",
+            "schema": {"type": "integer"},
+        }}},
+        410: {"description": "`since` is older than the tombstone retention window; refetch the full list"},
+    },
+)
+async def charities(
+    r: RedisDep,
+    db: ReadSessionDep,
+    request: Request,
+    since: Optional[int] = Query(default=None, ge=0),
+):
+    if since is not None:
+        # Only what changed after `since`: {"revision", "upserts", "deleted"}
+        fmt = wire.negotiate(request)
+        body = (await delta.changes_since(db, since)).model_dump_json()
+        return wire.respond(fmt, body if fmt == wire.JSON else wire.encode_entry(body))
+
+    tag, body, revision = await charity_cache.list_with_revision(r)
+
+    # The list version doubles as the ETag: clients revalidate for free and
+    # the compression middleware compresses each version only once.
+    fmt = wire.negotiate(request, columnar=True)
+    etag = wire.etag(tag, fmt)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Vary": "Accept"})
+    if fmt != wire.JSON:
+        body = wire.encode_list(fmt, tag, body)
+    # The `since` to pass for the next delta. Not the highest revision in
+    # the list: a newer entry can be cached before an older one lands.
+    return wire.respond(fmt, body, {"ETag": etag, REVISION_HEADER: str(revision)})
 
 
 @router.post("/charities", response_model=CharityRead)
-async def new_charity(data: CharityCreate, db: SessionDep, r: RedisDep):
+async def new_charity(data: CharityCreate, db: SessionDep, r: RedisDep, response: Response):
     # Check if username already exists
     stmt = select(Charity).where(Charity.username == data.username)
     results = await db.execute(stmt)
@@ -63,10 +86,11 @@ async def new_charity(data: CharityCreate, db: SessionDep, r: RedisDep):
             detail=f"Username '{data.username}' is already taken. Please choose a different username."
         )
     
-    data.password = hash_password(data.password)
-    feature = await geocode_address_to_features(address=data.address)
+    data.password = await hash_password(data.password)
+    feature = await geocode_address(data.address, r)
     payload = data.model_dump()
     charity = Charity(**payload,geojson=feature)
+    await delta.lock_revisions(db)
     db.add(charity)
     
     try:
@@ -85,10 +109,9 @@ async def new_charity(data: CharityCreate, db: SessionDep, r: RedisDep):
             detail="Failed to create charity account. Please try again."
         )
 
-    cur_ver = await _get_ver(r)
-    await r.delete(f"charities:all:v{cur_ver}")
-    await _bump_ver(r)
-    
+    await charity_cache.put_entry(r, charity)
+    pin_to_primary(response)
+
     return charity
 
 
@@ -114,47 +137,50 @@ async def charity_login(
     charity = results.scalars().first()
     if not charity:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    if not verify_password(data.password, charity.password):
+    if not await verify_password(data.password, charity.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
         )
 
-    sid = str(uuid.uuid4())
-    await r.setex(f"session:{sid}", 3600, json.dumps({"user_id": charity.id}))
+    sid = await sessions.create_session(r, charity.id)
 
 
     url = request.url_for("get_charity", id=charity.id)
     resp = RedirectResponse(url, status_code=status.HTTP_303_SEE_OTHER)
 
-    resp.set_cookie(
-        key="sid",
-        value=sid,
-        httponly=True,
-        secure=False,  
-        samesite="lax",
-        max_age=3600,
-        path="/",
-    )
+    sessions.set_cookie(resp, sid)
     return resp
 
 @router.get("/charities/me", response_model=CharityRead)
-async def get_current_charity(db: SessionDep, r: RedisDep, request: Request):
+async def get_current_charity(db: ReadSessionDep, r: RedisDep, request: Request, response: Response):
     """Get the currently logged-in charity based on session cookie"""
     sid = request.cookies.get("sid")
     if not sid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not logged in")
     
-    session_data = await r.get(f"session:{sid}")
-    if not session_data:
+    user_id = await sessions.session_user(r, sid)
+    if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired")
     
-    session = json.loads(session_data)
-    user_id = session.get("user_id")
-    
     charity = await db.get(Charity, user_id)
     if not charity:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Charity not found")
-    
+
+    # The frontend checks /charities/me on every page, which keeps short-lived
+    # tokens rolling while the charity is active.
+    try:
+        fresh = await sessions.refreshed_token(r, sid)
+    except RedisError:
+        fresh = None  # the token stays valid until it expires; refresh once Redis is back
+    if fresh is not None:
+        sessions.set_cookie(response, fresh)
+
+    fmt = wire.negotiate(request)
+    if fmt != wire.JSON:
+        resp = wire.respond(fmt, wire.encode_entry(charity_cache.encode_entry(charity)))
+        if fresh is not None:
+            sessions.set_cookie(resp, fresh)
+        return resp
     return charity
 
 
@@ -188,10 +214,24 @@ async def charity_logout(response: Response, request: Request, r: RedisDep):
     if sid is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
    
-    await r.delete(f"session:{sid}")
+    await sessions.revoke_session(r, sid)
     response.delete_cookie(key="sid")
     return {"ok": True}
 
+@router.post("/charities/logout-all")
+async def charity_logout_all(response: Response, request: Request, r: RedisDep):
+    """Log the current charity out of every browser it is signed in on"""
+    sid = request.cookies.get("sid")
+    if sid is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    user_id = await sessions.session_user(r, sid)
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired")
+
+    revoked = await sessions.revoke_all(r, user_id)
+    response.delete_cookie(key="sid")
+    return {"ok": True, "revoked": revoked}
+
 @router.get("/charities/{id}/edit")
 async def serve_edit_page(id: int):
     """Serve the React app for the edit page"""
@@ -200,27 +240,91 @@ async def serve_edit_page(id: int):
         return FileResponse(str(index_path))
     raise HTTPException(status_code=404, detail="Frontend not built. Run 'npm run build' in frontend directory.")
 
+@router.get("/charities/changes")
+async def charity_changes(request: Request):
+    """Server-Sent Events: one `upsert` or `delete` event per charity change"""
+    return StreamingResponse(
+        changes.events(request.app.state.changes, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        # Stop nginx and similar proxies from buffering the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/charities/search", response_model=list[CharityRead])
+async def search_charities(
+    r: RedisDep,
+    request: Request,
+    bbox: Optional[str] = Query(default=None, description="minLon,minLat,maxLon,maxLat"),
+    needs_volunteers: Optional[bool] = None,
+    needs_donations: Optional[bool] = None,
+    approved: Optional[bool] = None,
+):
+    """Charities in a bounding box and/or with the given flags, filtered over the shared catalog snapshot"""
+    box = None
+    if bbox is not None:
+        try:
+            box = tuple(float(v) for v in bbox.split(","))
+        except ValueError:
+            box = ()
+        if len(box) != 4 or box[0] > box[2] or box[1] > box[3]:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="bbox must be minLon,minLat,maxLon,maxLat")
+    mask = values = 0
+    for wanted, bit in (
+        (needs_volunteers, snapshot.NEEDS_VOLUNTEERS),
+        (needs_donations, snapshot.NEEDS_DONATIONS),
+        (approved, snapshot.APPROVED),
+    ):
+        if wanted is not None:
+            mask |= bit
+            values |= bit if wanted else 0
+
+    try:
+        tag = await charity_cache.get_tag(r)
+    except RedisError:
+        tag = None
+    snap = await snapshot.get(tag, lambda: charity_cache.list_body(r))
+
+    fmt = wire.negotiate(request)
+    etag = wire.etag(f"{snap.tag}-{zlib.crc32(request.url.query.encode()):08x}", fmt)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Vary": "Accept"})
+    body = snap.entries(snap.match(box, mask, values))
+    return wire.respond(fmt, body if fmt == wire.JSON else wire.encode_entry(body), {"ETag": etag})
+
 @router.get("/charities/{id}", response_model=CharityRead, name="get_charity")
-async def get_charity(id: int, db: SessionDep, r: RedisDep):
-    ver = await _get_charity_ver(id, r)
-    key = f"charities:{id}:v{ver}"
-    cache = await r.get(key)
+async def get_charity(id: int, db: ReadSessionDep, r: RedisDep, request: Request):
+    fmt = wire.negotiate(request)
+    try:
+        cache = await charity_cache.get_entry(r, id)
+        ver = None if cache else await charity_cache.get_ver(r)
+    except RedisError:
+        cache, ver = None, None  # straight from the database while Redis is down
     if cache:
-        print("cache used")
-        return json.loads(cache)
+        metrics.cache_hit("charity")
+        return wire.respond(fmt, cache if fmt == wire.JSON else wire.encode_entry(cache))
 
+    metrics.cache_miss("charity")
     charity = await db.get(Charity, id)
     if not charity:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    payload = jsonable_encoder(charity)
-    await r.setex(key, 180, json.dumps(payload))
-    return payload
+    # Only rows read from the primary go into the shared cache: a lagging
+    # replica could hand back a row an edit just replaced, and no later write
+    # would correct the entry.
+    if ver is None or not is_primary(db):
+        entry = charity_cache.encode_entry(charity)
+    else:
+        try:
+            entry = await charity_cache.fill_entry(r, charity, ver)
+        except RedisError:
+            entry = charity_cache.encode_entry(charity)
+    return wire.respond(fmt, entry if fmt == wire.JSON else wire.encode_entry(entry))
 
 @router.patch("/charities/{id}/edit", response_model=CharityRead)
 async def charity_edits(
     id: int,
     request: Request,
+    response: Response,
     data: CharityEdit,
     db: SessionDep,
     r: RedisDep,
@@ -228,7 +332,7 @@ async def charity_edits(
     sid = request.cookies.get("sid")
     if sid is None:
         raise HTTPException(status_code=status.HTTP_405_METHOD_NOT_ALLOWED)
-    if not await r.exists(f"session:{sid}"):
+    if await sessions.session_user(r, sid, write=True) is None:
         raise HTTPException(status_code=status.HTTP_405_METHOD_NOT_ALLOWED)
 
     charity = await db.get(Charity, id)
@@ -236,21 +340,29 @@ async def charity_edits(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
     payload = data.model_dump(exclude_unset=True)
-    for field, value in payload.items():
+    address = payload.pop("address", None)
+    if address is not None and address_changed(charity.address, address):
+        charity.geojson = await geocode_address(address, r)
+
+    changed = {
+        field: value
+        for field, value in payload.items()
+        if getattr(charity, field) != value
+    }
+    if address is not None and address != charity.address:
+        changed["address"] = address
+    if not changed:
+        return charity
+
+    await delta.lock_revisions(db)
+    for field, value in changed.items():
         setattr(charity, field, value)
 
     await db.commit()
     await db.refresh(charity)
 
-   
-    ent_ver = await _get_charity_ver(id, r)
-    await r.delete(f"charities:{id}:v{ent_ver}")
-    await _bump_charity_ver(id, r)
-
-
-    cur_ver = await _get_ver(r)
-    await r.delete(f"charities:all:v{cur_ver}")
-    await _bump_ver(r)
+    await charity_cache.put_entry(r, charity)
+    pin_to_primary(response)
 
     return charity
 
@@ -266,89 +378,31 @@ async def charity_delete(
     sid = request.cookies.get("sid")
     if sid is None:
         raise HTTPException(status_code=status.HTTP_405_METHOD_NOT_ALLOWED)
-    if not await r.exists(f"session:{sid}"):
+    if await sessions.session_user(r, sid, write=True) is None:
         raise HTTPException(status_code=status.HTTP_405_METHOD_NOT_ALLOWED)
 
     charity = await db.get(Charity, id)
     if not charity:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
+    await delta.lock_revisions(db)
     await db.delete(charity)
+    await delta.record_delete(db, id)
     await db.commit()
 
-   
-    await r.delete(f"session:{sid}")
-    response.delete_cookie(key="sid")
-
-    
-    ent_ver = await _get_charity_ver(id, r)
-    await r.delete(f"charities:{id}:v{ent_ver}")
-    await _bump_charity_ver(id, r)
 
+    try:
+        await sessions.revoke_all(r, id)
+    except RedisError:
+        pass  # the charity is gone, so its sessions can no longer write anyway
+    response.delete_cookie(key="sid")
 
-    cur_ver = await _get_ver(r)
-    await r.delete(f"charities:all:v{cur_ver}")
-    await _bump_ver(r)
+    await charity_cache.drop_entry(r, id)
 
     return {"ok": True}
 
 
 
-async def _get_charity_ver(id: int, r: RedisDep) -> int:
-    v = await r.get(f"charities:{id}:ver")
-    return int(v) if v is not None else 0
-
-async def _bump_charity_ver(id: int, r: RedisDep) -> int:
-    return await r.incr(f"charities:{id}:ver")
-
-async def _get_ver(r: RedisDep) -> int:
-    v = await r.get("charities:ver")
-    return int(v) if v is not None else 0
-
-async def _bump_ver(r: RedisDep) -> int:
-    return await r.incr("charities:ver")
-
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-def verify_password(plain: str, hashed: str) -> bool:
-    return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
-
-async def geocode_address_to_features(address: str) -> dict:
-    if not address:
-        raise HTTPException(status_code=400, detail="Address is required")
-    encoded = quote(address)
-
-    url = MAPBOX_GEOCODE_URL.format(query=encoded)
-    params = {
-        "access_token": MAPBOX_TOKEN,
-        "limit": 1,
-        "autocomplete": "false",
-    }
-
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(url, params=params)
-        try:
-            r.raise_for_status()
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(status_code=502, detail=f"Geocoding failed: {e.response.text}") from e
-
-    payload = r.json()
-    features = payload.get("features") or []
-    if not features:
-        raise HTTPException(status_code=400, detail="Address not found")
-
-    feat = features[0]  
-    return {
-        "type": "Feature",
-        "geometry": feat["geometry"],
-        "properties": {
-            "place_name": feat.get("place_name"),
-            "source": "mapbox",
-        },
-    }
-
-
 def ensure_session_token(st: Optional[str]) -> str:
     try:
         return st or str(uuid.uuid4())
@@ -393,14 +447,8 @@ async def suggest(
         if v is not None:
             params[k] = v
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(f"{BASE}/suggest", params=params)
-    if r.status_code != 200:
-        raise HTTPException(status_code=r.status_code, detail=r.text)
-
-    data = r.json()
-    data["_session_token"] = st
-    return data
+    data = await typeahead.fetch("suggest", f"{BASE}/suggest", params, session_token=session_token)
+    return {**data, "_session_token": st}
 
 @router.get("/api/retrieve/{mapbox_id}")
 async def retrieve(
@@ -427,11 +475,26 @@ async def retrieve(
         if v is not None:
             params[k] = v
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(f"{BASE}/retrieve/{mapbox_id}", params=params)
-    if r.status_code != 200:
-        raise HTTPException(status_code=r.status_code, detail=r.text)
-
-    data = r.json()
-    data["_session_token"] = st
-    return data
\ No newline at end of file
+    data = await typeahead.fetch("retrieve", f"{BASE}/retrieve/{mapbox_id}", params)
+    return {**data, "_session_token": st}
+
+@router.get("/api/zip/{code}")
+async def zip_centroid(code: str, response: Response):
+    """Center point of a US zip code, from the local index or Mapbox for codes it lacks."""
+    if not (len(code) == 5 and code.isdigit()):
+        raise HTTPException(400, "Zip code must be 5 digits")
+    response.headers["Cache-Control"] = "public, max-age=86400"
+
+    point = zipindex.lookup(code)
+    if point is not None:
+        metrics.cache_hit("zip_index")
+        return {"code": code, "longitude": round(point[0], 5), "latitude": round(point[1], 5), "source": "index"}
+    metrics.cache_miss("zip_index")
+
+    params = {"access_token": MAPBOX_TOKEN, "types": "postcode", "country": "us", "limit": 1}
+    data = await typeahead.fetch("zip", MAPBOX_GEOCODE_URL.format(query=code), params)
+    features = data.get("features") or []
+    if not features:
+        raise HTTPException(404, "Zip code not found")
+    lon, lat = features[0]["geometry"]["coordinates"]
+    return {"code": code, "longitude": lon, "latitude": lat, "source": "mapbox"}
\ No newline at end of file
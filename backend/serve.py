@@ -0,0 +1,107 @@
+# serve.py
+"""
+Production entry point.
+
+    python serve.py                       # one worker per CPU, gunicorn if available
+    python serve.py --workers 4 --port 8000 --server uvicorn
+
+Gunicorn preloads the app in the master and forks UvicornWorkers running
+uvloop and httptools. Without gunicorn (e.g. on Windows) it falls back to
+`uvicorn --workers`, which imports the app in each worker instead.
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def default_workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+
+def uvicorn_options() -> dict:
+    return {
+        "loop": "uvloop" if _available("uvloop") else "auto",
+        "http": "httptools" if _available("httptools") else "auto",
+    }
+
+
+def run_gunicorn(args) -> None:
+    from gunicorn.app.base import BaseApplication
+    from uvicorn_worker import UvicornWorker
+
+    class TunedUvicornWorker(UvicornWorker):
+        CONFIG_KWARGS = uvicorn_options()
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "worker_class": TunedUvicornWorker,
+                "preload_app": not args.no_preload,
+                "backlog": args.backlog,
+                "keepalive": args.keep_alive,
+                "graceful_timeout": args.graceful_timeout,
+                "timeout": args.timeout,
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests // 10,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+    Application().run()
+
+
+def run_uvicorn(args) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        **uvicorn_options(),
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn"],
+                        default="gunicorn" if _available("gunicorn") and sys.platform != "win32" else "uvicorn")
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("BACKLOG", "2048")))
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", "5")),
+                        help="seconds to hold idle keep-alive connections")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WORKER_TIMEOUT", "60")),
+                        help="gunicorn: restart workers silent for this long")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "0")),
+                        help="recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--no-preload", action="store_true", help="gunicorn: import the app in each worker")
+    args = parser.parse_args()
+
+    if args.server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# sessions.py
+"""
+Login sessions, in one of two modes (SESSION_MODE):
+
+redis (default)
+    Each session is a small hash at sess:{sid}; lookups HGET only the
+    charity id. Every charity also has a set of its live session ids, so
+    all of them can be revoked at once (logout everywhere, account deletion).
+
+token
+    The cookie carries a short-lived HMAC-signed token with the charity id,
+    so authenticating a read is pure CPU and keeps working while Redis is
+    degraded. Revocations are recorded in Redis and checked on writes and
+    before a token is refreshed; a revoked token can still read until it
+    expires (SESSION_TOKEN_TTL). A refreshed token keeps the token id and
+    login time of the one it replaces, so revoking either still applies.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+import uuid
+from typing import Optional
+
+import redis.asyncio as redis
+from fastapi import Response
+
+
+SESSION_MODE = os.getenv("SESSION_MODE", "redis")
+SESSION_TTL = 3600
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", "900"))
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+
+if SESSION_MODE not in ("redis", "token"):
+    raise RuntimeError(f"Unknown SESSION_MODE {SESSION_MODE!r}")
+if SESSION_MODE == "token" and len(SESSION_SECRET) < 32:
+    raise RuntimeError("SESSION_MODE=token requires a SESSION_SECRET of at least 32 characters")
+
+COOKIE_MAX_AGE = SESSION_TOKEN_TTL if SESSION_MODE == "token" else SESSION_TTL
+
+# Deletes every session listed in a charity's index, then the index itself,
+# in a single round trip.
+_REVOKE_ALL_LUA = """
+local sids = redis.call('SMEMBERS', KEYS[1])
+for _, sid in ipairs(sids) do
+    redis.call('DEL', ARGV[1] .. sid)
+end
+redis.call('DEL', KEYS[1])
+return #sids
+"""
+
+
+def _session_key(sid: str) -> str:
+    return f"sess:{sid}"
+
+
+def _index_key(user_id: int) -> str:
+    return f"charity:{user_id}:sessions"
+
+
+def _revoked_before_key(user_id: int) -> str:
+    return f"tok:revoked_before:{user_id}"
+
+
+def _revoked_token_key(jti: str) -> str:
+    return f"tok:revoked:{jti}"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _sign(payload: str) -> str:
+    mac = hmac.new(SESSION_SECRET.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest()
+    return _b64(mac)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def issue_token(user_id: int, jti: Optional[str] = None, login: Optional[int] = None) -> str:
+    """
+    Token layout: {charity id}.{issued at, ms}.{token id}.{login time, ms}.{signature}
+    A refresh passes the token id and login time of the token it replaces.
+    """
+    iat = _now_ms()
+    payload = f"{user_id}.{iat}.{jti or secrets.token_hex(8)}.{iat if login is None else login}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(token: str) -> Optional[tuple[int, int, str, int]]:
+    """Return (charity id, issued at in ms, token id, login time in ms) for a valid, unexpired token."""
+    try:
+        payload, signature = token.rsplit(".", 1)
+        uid, iat, jti, login = payload.split(".")
+        user_id, issued, logged_in = int(uid), int(iat), int(login)
+    except ValueError:
+        return None
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    if _now_ms() - issued >= SESSION_TOKEN_TTL * 1000:
+        return None
+    return user_id, issued, jti, logged_in
+
+
+async def _token_revoked(r: redis.Redis, user_id: int, jti: str, login: int) -> bool:
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.get(_revoked_before_key(user_id))
+        pipe.exists(_revoked_token_key(jti))
+        revoked_before, revoked = await pipe.execute()
+    return bool(revoked) or (revoked_before is not None and login <= int(revoked_before))
+
+
+def set_cookie(response: Response, sid: str) -> None:
+    response.set_cookie(
+        key="sid",
+        value=sid,
+        httponly=True,
+        secure=False,
+        samesite="lax",
+        max_age=COOKIE_MAX_AGE,
+        path="/",
+    )
+
+
+async def create_session(r: redis.Redis, user_id: int) -> str:
+    if SESSION_MODE == "token":
+        return issue_token(user_id)
+    sid = str(uuid.uuid4())
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(_session_key(sid), mapping={"uid": user_id, "created": int(time.time())})
+        pipe.expire(_session_key(sid), SESSION_TTL)
+        pipe.sadd(_index_key(user_id), sid)
+        # The index outlives its newest session and no longer; ids of expired
+        # sessions left in it are harmless to revoke.
+        pipe.expire(_index_key(user_id), SESSION_TTL)
+        await pipe.execute()
+    return sid
+
+
+async def session_user(r: redis.Redis, sid: str, *, write: bool = False) -> Optional[int]:
+    """
+    Charity id of the session, or None. In token mode only `write=True`
+    checks the revocation list in Redis.
+    """
+    if SESSION_MODE == "token":
+        claims = decode_token(sid)
+        if claims is None:
+            return None
+        user_id, _, jti, login = claims
+        if write and await _token_revoked(r, user_id, jti, login):
+            return None
+        return user_id
+
+    uid = await r.hget(_session_key(sid), "uid")
+    return int(uid) if uid is not None else None
+
+
+async def refreshed_token(r: redis.Redis, sid: str) -> Optional[str]:
+    """
+    In token mode, a fresh token once the current one is past half its
+    life, unless it has been revoked. Raises RedisError if the revocation
+    list can't be read.
+    """
+    if SESSION_MODE != "token":
+        return None
+    claims = decode_token(sid)
+    if claims is None or _now_ms() - claims[1] < SESSION_TOKEN_TTL * 500:
+        return None
+    user_id, _, jti, login = claims
+    if await _token_revoked(r, user_id, jti, login):
+        return None
+    return issue_token(user_id, jti, login)
+
+
+async def revoke_session(r: redis.Redis, sid: str) -> None:
+    if SESSION_MODE == "token":
+        claims = decode_token(sid)
+        if claims is not None:
+            # Refreshes share the token id, and the newest of them may have
+            # been issued just now, so the entry lives for a full token TTL.
+            await r.setex(_revoked_token_key(claims[2]), SESSION_TOKEN_TTL, 1)
+        return
+
+    uid = await session_user(r, sid)
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.delete(_session_key(sid))
+        if uid is not None:
+            pipe.srem(_index_key(uid), sid)
+        await pipe.execute()
+
+
+async def revoke_all(r: redis.Redis, user_id: int) -> int:
+    """Revoke every session of a charity; returns how many were listed (0 in token mode)."""
+    if SESSION_MODE == "token":
+        await r.setex(_revoked_before_key(user_id), SESSION_TOKEN_TTL, _now_ms())
+        return 0
+    script = r.register_script(_REVOKE_ALL_LUA)
+    return await script(keys=[_index_key(user_id)], args=[_session_key("")])
@@ -0,0 +1,229 @@
+# snapshot.py
+"""
+The charity catalog as a memory-mapped snapshot shared by every worker
+on a host.
+
+The first worker to see a new list version writes the list into a
+binary file under SNAPSHOT_DIR (tmpfs /dev/shm where available). Every
+worker then maps that file read-only, so a host holds one copy however
+many workers it runs. Filters run over the mapped columns without
+decoding any JSON, and matches are answered by joining their
+already-encoded entries.
+
+    header    magic b"CSNP", u16 version, u16 reserved, u32 count,
+              u64 strings size, 32 bytes of tag (NUL-padded)
+    revisions i64[count]
+    ids       u32[count]
+    coords    f32[count*2]   lon, lat; NaN when a charity has no point
+    offsets   u32[count+1]   entry i is strings[offsets[i]:offsets[i+1]]
+    flags     u8[count]      NEEDS_VOLUNTEERS | NEEDS_DONATIONS | APPROVED
+    strings   the CharityRead JSON of each entry, back to back
+
+All little-endian. Files are named after the list tag (the Redis epoch
+and charities:ver version, or the database-derived tag during a Redis
+outage), so workers that race to build the same version write identical
+files and the last os.replace wins. The newest few are kept; older ones
+are unlinked, which doesn't disturb workers that still have them mapped.
+
+numpy, when installed, vectorizes the filters; without it they loop in
+Python over the same mapped memory.
+"""
+import asyncio
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import anyio
+
+from profiling import span
+from wire import point
+
+
+SNAPSHOT_DIR = Path(os.getenv(
+    "SNAPSHOT_DIR",
+    "/dev/shm/charity-catalog" if os.path.isdir("/dev/shm") else Path(tempfile.gettempdir()) / "charity-catalog",
+))
+SNAPSHOTS_KEPT = 3
+
+MAGIC = b"CSNP"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHIQ32s")
+
+NEEDS_VOLUNTEERS, NEEDS_DONATIONS, APPROVED = 1, 2, 4
+
+_np = None  # numpy module once imported; False if it isn't installed
+
+
+def _numpy():
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np
+
+
+def _path(tag: str) -> Path:
+    return SNAPSHOT_DIR / f"catalog-{re.sub(r'[^A-Za-z0-9-]', '_', tag)}.bin"
+
+
+def build(tag: str, body: str) -> Path:
+    """Write the snapshot of the JSON list `body` tagged `tag`; returns its path."""
+    if len(tag.encode()) > 32:
+        raise ValueError(f"snapshot tag {tag!r} is longer than 32 bytes")
+    items = json.loads(body)
+    count = len(items)
+    revisions = array("q", (item["revision"] for item in items))
+    ids = array("I", (item["id"] for item in items))
+    coords = array("f")
+    flags = bytearray(count)
+    offsets = array("I", [0])
+    strings = bytearray()
+    for i, item in enumerate(items):
+        coords.extend(point(item))
+        flags[i] = (
+            (NEEDS_VOLUNTEERS if item["needs_volunteers"] else 0)
+            | (NEEDS_DONATIONS if item["needs_donations"] else 0)
+            | (APPROVED if item["is_approved"] else 0)
+        )
+        strings += json.dumps(item, separators=(",", ":")).encode()
+        offsets.append(len(strings))
+    if sys.byteorder == "big":
+        for column in (revisions, ids, coords, offsets):
+            column.byteswap()
+
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    path = _path(tag)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, VERSION, 0, count, len(strings), tag.encode()))
+        for column in (revisions, ids, coords, offsets):
+            out.write(column.tobytes())
+        out.write(flags)
+        out.write(strings)
+    os.replace(tmp, path)
+    _prune()
+    return path
+
+
+def _prune() -> None:
+    files = sorted(SNAPSHOT_DIR.glob("catalog-*.bin"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[SNAPSHOTS_KEPT:]:
+        try:
+            old.unlink()
+        except OSError:
+            pass  # another worker pruned it first
+
+
+class Snapshot:
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, strings_size, tag = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} catalog snapshot")
+        self.count = count
+        self.tag = tag.rstrip(b"\0").decode()
+
+        pos = _HEADER.size
+        layout = {}
+        for name, typecode, length in (
+            ("revisions", "q", count), ("ids", "I", count), ("coords", "f", 2 * count),
+            ("offsets", "I", count + 1), ("flags", "B", count),
+        ):
+            size = length * array(typecode).itemsize
+            layout[name] = (pos, typecode, length)
+            pos += size
+        self._strings = pos
+        if len(self._mm) != pos + strings_size:
+            raise ValueError(f"{path} is truncated")
+
+        np = _numpy()
+        view = memoryview(self._mm)
+        for name, (start, typecode, length) in layout.items():
+            if np:
+                column = np.frombuffer(self._mm, dtype=np.dtype(typecode).newbyteorder("<"), count=length, offset=start)
+            elif sys.byteorder == "little":
+                column = view[start:start + length * array(typecode).itemsize].cast(typecode)
+            else:
+                column = array(typecode, view[start:start + length * array(typecode).itemsize])
+                column.byteswap()
+            setattr(self, name, column)
+
+    def match(self, bbox: Optional[Tuple[float, float, float, float]], flags: int, flag_values: int) -> List[int]:
+        """Row numbers inside `bbox` (min lon, min lat, max lon, max lat) whose `flags` bits equal `flag_values`."""
+        np = _numpy()
+        if np:
+            keep = (self.flags & flags) == flag_values
+            if bbox is not None:
+                lon, lat = self.coords[0::2], self.coords[1::2]
+                keep &= (lon >= bbox[0]) & (lon <= bbox[2]) & (lat >= bbox[1]) & (lat <= bbox[3])
+            return np.flatnonzero(keep).tolist()
+
+        if bbox is None:
+            return [i for i, f in enumerate(self.flags) if f & flags == flag_values]
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return [
+            i for i, (f, lon, lat) in enumerate(zip(self.flags, self.coords[0::2], self.coords[1::2]))
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat and f & flags == flag_values
+        ]
+
+    def entries(self, rows: List[int]) -> bytes:
+        """The JSON array of the given rows' entries."""
+        base, offsets, mm = self._strings, self.offsets, self._mm
+        return b"[" + b",".join(mm[base + int(offsets[i]):base + int(offsets[i + 1])] for i in rows) + b"]"
+
+
+_current: Optional[Snapshot] = None
+_loading: Optional[asyncio.Task] = None
+
+
+def _map(tag: str) -> Optional[Snapshot]:
+    try:
+        return Snapshot(_path(tag))
+    except (OSError, ValueError):
+        return None  # not built yet, pruned, or mid-replace
+
+
+def _build_and_map(tag: str, body: str) -> Snapshot:
+    return Snapshot(build(tag, body))
+
+
+async def get(tag: Optional[str], fetch: Callable[[], Awaitable[Tuple[str, str]]]) -> Snapshot:
+    """
+    The mapped snapshot for list version `tag`. If another worker on this
+    host already wrote it, it is only mapped; otherwise `fetch` supplies
+    (tag, JSON list body) and this worker writes it. `tag` is None when the
+    version isn't known without fetching. Concurrent callers share one load.
+    """
+    global _loading
+    if _current is not None and _current.tag == tag:
+        return _current
+    if _loading is None or _loading.done():
+        _loading = asyncio.create_task(_load(tag, fetch))
+    return await asyncio.shield(_loading)
+
+
+async def _load(tag: Optional[str], fetch: Callable[[], Awaitable[Tuple[str, str]]]) -> Snapshot:
+    global _current
+    snap = await anyio.to_thread.run_sync(_map, tag) if tag is not None else None
+    if snap is None:
+        tag, body = await fetch()
+        if _current is not None and _current.tag == tag:
+            return _current
+        snap = await anyio.to_thread.run_sync(_map, tag)
+        if snap is None:
+            with span("serialize", "snapshot"):
+                snap = await anyio.to_thread.run_sync(_build_and_map, tag, body)
+    # Requests still holding the previous snapshot keep it mapped until they finish.
+    _current = snap
+    return snap
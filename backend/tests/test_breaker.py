@@ -0,0 +1,91 @@
+import pytest
+
+import breaker
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cb(request, clock):
+    return CircuitBreaker(f"test_{request.node.name}", failure_threshold=3, reset_timeout=10)
+
+
+def test_opens_after_threshold_failures_in_a_row(cb):
+    cb.failure()
+    cb.failure()
+    assert cb.state == CLOSED
+    cb.acquire()
+    cb.failure()
+    assert cb.state == OPEN
+    with pytest.raises(CircuitOpen) as e:
+        cb.acquire()
+    assert e.value.retry_after == 10
+
+
+def test_success_resets_the_failure_count(cb):
+    cb.failure()
+    cb.failure()
+    cb.success()
+    cb.failure()
+    cb.failure()
+    assert cb.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through(cb, clock):
+    for _ in range(3):
+        cb.failure()
+    clock[0] += 10
+    assert cb.state == HALF_OPEN
+    cb.acquire()
+    with pytest.raises(CircuitOpen):
+        cb.acquire()
+
+
+def test_successful_probe_closes(cb, clock):
+    for _ in range(3):
+        cb.failure()
+    clock[0] += 10
+    cb.acquire()
+    cb.success()
+    assert cb.state == CLOSED
+    cb.acquire()
+    cb.acquire()
+
+
+def test_failed_probe_reopens_for_a_full_timeout(cb, clock):
+    for _ in range(3):
+        cb.failure()
+    clock[0] += 10
+    cb.acquire()
+    cb.failure()
+    assert cb.state == OPEN
+    clock[0] += 9
+    assert cb.state == OPEN
+    clock[0] += 1
+    assert cb.state == HALF_OPEN
+
+
+def test_lost_probe_is_replaced_after_a_timeout(cb, clock):
+    for _ in range(3):
+        cb.failure()
+    clock[0] += 10
+    cb.acquire()  # never reports back
+    clock[0] += 5
+    with pytest.raises(CircuitOpen):
+        cb.acquire()
+    clock[0] += 5
+    cb.acquire()
+
+
+def test_redis_circuit_open_is_a_redis_connection_error(cb):
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    for _ in range(3):
+        cb.failure()
+    with pytest.raises(RedisConnectionError):
+        cb.acquire(breaker.RedisCircuitOpen)
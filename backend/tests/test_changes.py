@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import changes
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def _next(gen):
+    return await asyncio.wait_for(gen.__anext__(), 3)
+
+
+async def test_entry_added_right_after_ready_is_delivered(r):
+    b = changes.Broadcaster(r)
+    gen = changes.events(b, None)
+    try:
+        assert "event: ready" in await _next(gen)
+        # Nothing has yielded to the read loop since `ready`.
+        await r.xadd(changes.STREAM_KEY, {"op": "delete", "id": 2})
+        assert 'data: {"id": 2}' in await _next(gen)
+    finally:
+        await gen.aclose()
+        await b.close()
+
+
+async def test_resume_replays_missed_entries(r):
+    seen = await r.xadd(changes.STREAM_KEY, {"op": "delete", "id": 1})
+    await r.xadd(changes.STREAM_KEY, {"op": "upsert", "id": 2, "data": '{"id":2}'})
+    b = changes.Broadcaster(r)
+    gen = changes.events(b, seen)
+    try:
+        event = await _next(gen)
+        assert "event: upsert" in event and 'data: {"id":2}' in event
+    finally:
+        await gen.aclose()
+        await b.close()
+
+
+async def test_resume_past_trimmed_entries_resets(r):
+    await r.xadd(changes.STREAM_KEY, {"op": "delete", "id": 1}, id="5-0")
+    b = changes.Broadcaster(r)
+    gen = changes.events(b, "1-0")
+    try:
+        assert "event: reset" in await _next(gen)
+    finally:
+        await gen.aclose()
+        await b.close()
+
+
+async def test_client_is_unsubscribed_when_the_stream_closes(r):
+    b = changes.Broadcaster(r)
+    gen = changes.events(b, None)
+    await _next(gen)
+    assert len(b.clients) == 1
+    await gen.aclose()
+    assert not b.clients
+    await b.close()
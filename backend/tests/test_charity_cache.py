@@ -0,0 +1,193 @@
+import json
+
+import pytest
+
+import changes
+import charity_cache
+from models.dbmodels import Charity
+
+
+pytestmark = pytest.mark.anyio
+
+
+class _Stop(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def no_worker_state(monkeypatch):
+    monkeypatch.setattr(charity_cache, "_rebuild_task", None)
+    monkeypatch.setattr(charity_cache, "_local_list", None)
+    monkeypatch.setattr(charity_cache, "_missed_write", False)
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    """Record warm rebuilds instead of reading the database, and run one warm pass per call."""
+    calls = []
+
+    async def rebuild(r):
+        calls.append(1)
+        await r.setex(charity_cache.READY_KEY, charity_cache.ENTRIES_TTL, 0)
+        return "v0", "[]"
+
+    async def sleep(seconds):
+        raise _Stop
+
+    monkeypatch.setattr(charity_cache, "rebuild", rebuild)
+    monkeypatch.setattr(charity_cache.asyncio, "sleep", sleep)
+    return calls
+
+
+async def _warm_once(r):
+    with pytest.raises(_Stop):
+        await charity_cache.warm_forever(r)
+
+
+async def test_warm_rebuilds_a_cold_list(r, rebuilds):
+    await _warm_once(r)
+    assert len(rebuilds) == 1
+    assert await r.ttl(charity_cache.READY_KEY) > charity_cache.WARM_MARGIN
+
+
+async def test_warm_rebuilds_before_expiry(r, rebuilds):
+    await r.setex(charity_cache.READY_KEY, charity_cache.WARM_MARGIN - 1, 0)
+    await _warm_once(r)
+    assert len(rebuilds) == 1
+
+
+async def test_warm_leaves_a_fresh_list_alone(r, rebuilds):
+    await r.setex(charity_cache.READY_KEY, charity_cache.WARM_MARGIN + 60, 0)
+    await _warm_once(r)
+    assert rebuilds == []
+
+
+async def test_only_one_worker_warms_per_interval(r, rebuilds):
+    await _warm_once(r)
+    await r.delete(charity_cache.READY_KEY)
+    # Another worker in the same interval finds the lock taken.
+    await _warm_once(r)
+    assert len(rebuilds) == 1
+    assert 0 < await r.ttl(charity_cache.WARM_LOCK_KEY) <= charity_cache.WARM_INTERVAL
+
+    await r.delete(charity_cache.WARM_LOCK_KEY)
+    await _warm_once(r)
+    assert len(rebuilds) == 2
+
+
+async def test_missed_write_rebuilds_and_resets_dashboards(r, rebuilds, monkeypatch):
+    await r.setex(charity_cache.READY_KEY, charity_cache.ENTRIES_TTL, 0)
+    monkeypatch.setattr(charity_cache, "_missed_write", True)
+    await _warm_once(r)
+    assert len(rebuilds) == 1
+    assert charity_cache._missed_write is False
+    [(_, fields)] = await r.xrange(changes.STREAM_KEY)
+    assert fields["op"] == "reset"
+
+
+async def test_warm_survives_a_failed_rebuild(r, rebuilds, monkeypatch):
+    async def rebuild(r):
+        raise ConnectionError("db down")
+
+    monkeypatch.setattr(charity_cache, "rebuild", rebuild)
+    monkeypatch.setattr(charity_cache, "_missed_write", True)
+    await _warm_once(r)
+    # The flag stays set so the next pass retries.
+    assert charity_cache._missed_write is True
+
+
+def _charity(id, revision, **fields):
+    values = dict(
+        id=id, username=f"c{id}", password="x" * 8, name=f"Charity {id}", address="1 Main St",
+        contact="c@example.org", needs_volunteers=False, needs_donations=False, is_approved=False,
+        geojson={"type": "Feature", "geometry": {"type": "Point", "coordinates": [-70.0, 40.0]}},
+        revision=revision,
+    )
+    values.update(fields)
+    return Charity(**values)
+
+
+async def _cached(r, id):
+    entry = await charity_cache.get_entry(r, id)
+    return json.loads(entry) if entry is not None else None
+
+
+async def _feed(r):
+    return [(fields["op"], int(fields["id"])) for _, fields in await r.xrange(changes.STREAM_KEY)]
+
+
+@pytest.fixture
+async def ready(r):
+    await charity_cache.get_tag(r)
+    await charity_cache.fill_list(r, [], 0)
+
+
+async def test_put_entry_writes_and_publishes(r, ready):
+    assert await charity_cache.put_entry(r, _charity(1, 10)) == 1
+    assert (await _cached(r, 1))["revision"] == 10
+    assert await _feed(r) == [("upsert", 1)]
+
+
+async def test_older_put_entry_cannot_replace_a_newer_one(r, ready):
+    # The approve committed after the edit but reached Redis first.
+    await charity_cache.put_entry(r, _charity(1, 11, is_approved=True))
+    assert await charity_cache.put_entry(r, _charity(1, 10, name="edited")) == 1
+
+    entry = await _cached(r, 1)
+    assert (entry["revision"], entry["is_approved"]) == (11, True)
+    assert await _feed(r) == [("upsert", 1)]
+    _, body = await charity_cache.list_body(r)
+    assert [c["revision"] for c in json.loads(body)] == [11]
+
+
+async def test_put_entries_skips_only_the_stale_entries(r, ready):
+    await charity_cache.put_entry(r, _charity(1, 11))
+    assert await charity_cache.put_entries(r, [_charity(1, 10), _charity(2, 12)]) == 2
+    assert (await _cached(r, 1))["revision"] == 11
+    assert (await _cached(r, 2))["revision"] == 12
+    assert await _feed(r) == [("upsert", 1), ("upsert", 2)]
+
+
+async def test_put_after_a_read_through_fill_still_publishes(r, ready):
+    await charity_cache.fill_entry(r, _charity(1, 10), 0)
+    await charity_cache.put_entry(r, _charity(1, 10))
+    assert await _feed(r) == [("upsert", 1)]
+
+
+async def test_fill_list_loses_to_a_concurrent_write(r, ready):
+    ver = await charity_cache.get_ver(r)
+    # The rebuild read the database before this write committed.
+    stale = [_charity(1, 10), _charity(2, 11)]
+    await charity_cache.put_entry(r, _charity(1, 12, name="edited"))
+    await charity_cache.fill_list(r, stale, ver)
+
+    assert (await _cached(r, 1))["revision"] == 12
+    assert await _cached(r, 2) is None
+
+
+async def test_drop_entry(r, ready):
+    await charity_cache.put_entries(r, [_charity(1, 10), _charity(2, 11)])
+    assert await charity_cache.drop_entry(r, 1) == 2
+    assert await _cached(r, 1) is None
+    _, body = await charity_cache.list_body(r)
+    assert [c["id"] for c in json.loads(body)] == [2]
+    assert await _feed(r) == [("upsert", 1), ("upsert", 2), ("delete", 1)]
+
+
+async def test_edit_arriving_after_the_delete_stays_deleted(r, ready):
+    await charity_cache.put_entry(r, _charity(1, 10))
+    await charity_cache.drop_entry(r, 1)
+    await charity_cache.put_entry(r, _charity(1, 11, name="edited"))
+    assert await _cached(r, 1) is None
+    assert await _feed(r) == [("upsert", 1), ("delete", 1)]
+
+
+async def test_list_revision_is_the_rebuilds_not_the_newest_entry(r, ready):
+    ver = await charity_cache.get_ver(r)
+    await charity_cache.fill_list(r, [_charity(1, 10), _charity(2, 11)], ver)
+    # Revision 12 committed but hasn't reached Redis; 13 has.
+    await charity_cache.put_entry(r, _charity(3, 13))
+
+    tag, body, revision = await charity_cache.list_with_revision(r)
+    assert revision == 11
+    assert sorted(c["revision"] for c in json.loads(body)) == [10, 11, 13]
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+import delta
+from models.dbmodels import Charity, CharityTombstone
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def _insert(db, name: str) -> Charity:
+    charity = Charity(
+        username=name, password="x" * 8, name=name, address="1 Main St", contact="c@example.org",
+        needs_volunteers=False, needs_donations=False, is_approved=True,
+        geojson={"type": "Feature", "geometry": {"type": "Point", "coordinates": [-70.0, 40.0]}},
+    )
+    await delta.lock_revisions(db)
+    db.add(charity)
+    await db.commit()
+    await db.refresh(charity)
+    return charity
+
+
+async def _delete(db, charity: Charity) -> None:
+    await delta.lock_revisions(db)
+    await db.delete(charity)
+    await delta.record_delete(db, charity.id)
+    await db.commit()
+
+
+async def test_since_returns_inserts_and_updates_in_revision_order(db):
+    a = await _insert(db, "alpha")
+    b = await _insert(db, "bravo")
+    assert a.revision < b.revision
+
+    changes = await delta.changes_since(db, 0)
+    assert [c.id for c in changes.upserts] == [a.id, b.id]
+    assert changes.revision == b.revision and changes.deleted == []
+
+    await delta.lock_revisions(db)
+    a.name = "alpha 2"
+    await db.commit()
+    await db.refresh(a)
+    assert a.revision > b.revision
+
+    changes = await delta.changes_since(db, b.revision)
+    assert [(c.id, c.name) for c in changes.upserts] == [(a.id, "alpha 2")]
+    assert changes.revision == a.revision
+
+
+async def test_nothing_new_keeps_the_revision(db):
+    a = await _insert(db, "alpha")
+    changes = await delta.changes_since(db, a.revision)
+    assert (changes.upserts, changes.deleted, changes.revision) == ([], [], a.revision)
+
+
+async def test_deletes_leave_tombstones(db):
+    a = await _insert(db, "alpha")
+    b = await _insert(db, "bravo")
+    seen = b.revision
+    await _delete(db, a)
+
+    changes = await delta.changes_since(db, seen)
+    assert changes.upserts == []
+    assert changes.deleted == [a.id]
+    assert changes.revision > seen
+    # A client that never saw the charity still learns it is gone.
+    assert a.id in (await delta.changes_since(db, 0)).deleted
+
+
+async def test_since_before_purged_tombstones_is_gone(db):
+    a = await _insert(db, "alpha")
+    b = await _insert(db, "bravo")
+    await _delete(db, a)
+    expired = datetime.now(timezone.utc) - timedelta(days=delta.TOMBSTONE_RETENTION_DAYS + 1)
+    await db.execute(update(CharityTombstone).values(deleted_at=expired))
+    await db.commit()
+    purged_revision = (await delta.changes_since(db, 0)).revision
+
+    # The next delete purges the expired tombstone.
+    await _delete(db, b)
+    assert await db.get(CharityTombstone, a.id) is None
+
+    with pytest.raises(HTTPException) as e:
+        await delta.changes_since(db, purged_revision - 1)
+    assert e.value.status_code == 410
+    changes = await delta.changes_since(db, purged_revision)
+    assert changes.deleted == [b.id]
@@ -0,0 +1,128 @@
+import pytest
+
+import sessions
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def token_mode(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_MODE", "token")
+    monkeypatch.setattr(sessions, "SESSION_SECRET", "s" * 32)
+    monkeypatch.setattr(sessions, "SESSION_TOKEN_TTL", 900)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000_000]
+    monkeypatch.setattr(sessions, "_now_ms", lambda: now[0])
+    return now
+
+
+def test_token_round_trip(clock):
+    token = sessions.issue_token(7)
+    user_id, issued, jti, login = sessions.decode_token(token)
+    assert (user_id, issued, login) == (7, clock[0], clock[0])
+    assert jti
+
+
+def test_tampered_token_is_rejected():
+    uid, rest = sessions.issue_token(7).split(".", 1)
+    assert sessions.decode_token(f"8.{rest}") is None
+    assert sessions.decode_token("garbage") is None
+
+
+def test_token_expires(clock):
+    token = sessions.issue_token(7)
+    clock[0] += 900 * 1000
+    assert sessions.decode_token(token) is None
+
+
+async def test_write_check_honours_revocation(r, clock):
+    token = sessions.issue_token(7)
+    assert await sessions.session_user(r, token, write=True) == 7
+    await sessions.revoke_session(r, token)
+    # Reads don't consult Redis, writes do.
+    assert await sessions.session_user(r, token) == 7
+    assert await sessions.session_user(r, token, write=True) is None
+
+
+async def test_refresh_only_after_half_life(r, clock):
+    token = sessions.issue_token(7)
+    assert await sessions.refreshed_token(r, token) is None
+    clock[0] += 450 * 1000
+    fresh = await sessions.refreshed_token(r, token)
+    assert fresh is not None
+    old, new = sessions.decode_token(token), sessions.decode_token(fresh)
+    assert new[1] == clock[0]
+    # The refresh keeps the token id and login time.
+    assert (new[0], new[2], new[3]) == (old[0], old[2], old[3])
+
+
+async def test_refresh_after_logout_returns_none(r, clock):
+    token = sessions.issue_token(7)
+    await sessions.revoke_session(r, token)
+    clock[0] += 450 * 1000
+    assert await sessions.refreshed_token(r, token) is None
+
+
+async def test_refresh_after_logout_all_returns_none(r, clock):
+    token = sessions.issue_token(7)
+    clock[0] += 10 * 1000
+    await sessions.revoke_all(r, 7)
+    clock[0] += 440 * 1000
+    assert await sessions.refreshed_token(r, token) is None
+    assert await sessions.session_user(r, token, write=True) is None
+
+
+async def test_refreshed_token_cannot_outlive_revocation(r, clock):
+    token = sessions.issue_token(7)
+    clock[0] += 450 * 1000
+    fresh = await sessions.refreshed_token(r, token)
+
+    # Revoking the original also revokes its refreshes, and vice versa.
+    await sessions.revoke_session(r, token)
+    assert await sessions.session_user(r, fresh, write=True) is None
+
+    clock[0] += 450 * 1000
+    assert await sessions.refreshed_token(r, fresh) is None
+
+
+async def test_revoke_all_spares_later_logins(r, clock):
+    await sessions.revoke_all(r, 7)
+    clock[0] += 1
+    token = sessions.issue_token(7)
+    assert await sessions.session_user(r, token, write=True) == 7
+
+
+class TestRedisMode:
+    @pytest.fixture(autouse=True)
+    def redis_mode(self, monkeypatch):
+        monkeypatch.setattr(sessions, "SESSION_MODE", "redis")
+
+    async def test_create_and_look_up(self, r):
+        sid = await sessions.create_session(r, 7)
+        assert await sessions.session_user(r, sid) == 7
+        assert await sessions.session_user(r, "unknown") is None
+        assert 0 < await r.ttl(f"sess:{sid}") <= sessions.SESSION_TTL
+
+    async def test_revoke_one(self, r):
+        sid = await sessions.create_session(r, 7)
+        other = await sessions.create_session(r, 7)
+        await sessions.revoke_session(r, sid)
+        assert await sessions.session_user(r, sid) is None
+        assert await sessions.session_user(r, other) == 7
+        assert await r.smembers("charity:7:sessions") == {other}
+
+    async def test_revoke_all(self, r):
+        sids = [await sessions.create_session(r, 7) for _ in range(3)]
+        keep = await sessions.create_session(r, 8)
+        assert await sessions.revoke_all(r, 7) == 3
+        for sid in sids:
+            assert await sessions.session_user(r, sid) is None
+        assert await sessions.session_user(r, keep) == 8
+
+    async def test_no_refresh_in_redis_mode(self, r):
+        sid = await sessions.create_session(r, 7)
+        assert await sessions.refreshed_token(r, sid) is None
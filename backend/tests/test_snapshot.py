@@ -0,0 +1,122 @@
+import json
+import math
+
+import pytest
+
+import snapshot
+
+
+def _item(id, lon, lat, volunteers=False, donations=False, approved=True):
+    geojson = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}} if lon is not None else {}
+    return {
+        "id": id, "username": f"c{id}", "name": f"Charity {id} – café", "address": "1 Main St",
+        "description": "", "website": "", "contact": "c@example.org",
+        "needs_volunteers": volunteers, "needs_donations": donations, "is_approved": approved,
+        "geojson": geojson, "revision": 100 + id,
+    }
+
+
+ITEMS = [
+    _item(1, -73.9, 40.7, volunteers=True),
+    _item(2, -118.2, 34.0, donations=True, approved=False),
+    _item(3, -87.6, 41.8, volunteers=True, donations=True),
+    _item(4, None, None),
+]
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", tmp_path)
+    monkeypatch.setattr(snapshot, "_current", None)
+    monkeypatch.setattr(snapshot, "_loading", None)
+    return tmp_path
+
+
+@pytest.fixture(params=["numpy", "python"])
+def filters(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(snapshot, "_np", None)
+    else:
+        monkeypatch.setattr(snapshot, "_np", False)
+    return request.param
+
+
+def test_round_trip(filters):
+    snap = snapshot.Snapshot(snapshot.build("vabc-7", json.dumps(ITEMS)))
+    assert snap.tag == "vabc-7" and snap.count == 4
+    assert [int(i) for i in snap.ids] == [1, 2, 3, 4]
+    assert [int(r) for r in snap.revisions] == [101, 102, 103, 104]
+    assert math.isclose(snap.coords[0], -73.9, abs_tol=1e-4) and math.isclose(snap.coords[1], 40.7, abs_tol=1e-4)
+    assert math.isnan(snap.coords[6])
+    assert int(snap.flags[2]) == snapshot.NEEDS_VOLUNTEERS | snapshot.NEEDS_DONATIONS | snapshot.APPROVED
+    assert json.loads(snap.entries(range(4))) == ITEMS
+
+
+def test_filters(filters):
+    snap = snapshot.Snapshot(snapshot.build("v1", json.dumps(ITEMS)))
+    east = (-100.0, 30.0, -70.0, 45.0)
+    assert snap.match(None, 0, 0) == [0, 1, 2, 3]
+    assert snap.match(east, 0, 0) == [0, 2]
+    assert snap.match(None, snapshot.APPROVED, 0) == [1]
+    assert snap.match(east, snapshot.NEEDS_DONATIONS, snapshot.NEEDS_DONATIONS) == [2]
+    assert snap.match((0.0, 0.0, 1.0, 1.0), 0, 0) == []
+    assert json.loads(snap.entries(snap.match(east, 0, 0))) == [ITEMS[0], ITEMS[2]]
+
+
+def test_empty_catalog():
+    snap = snapshot.Snapshot(snapshot.build("v0", "[]"))
+    assert snap.count == 0
+    assert snap.match(None, 0, 0) == []
+    assert snap.entries([]) == b"[]"
+
+
+def test_rejects_bad_files(snapshot_dir):
+    path = snapshot.build("v1", json.dumps(ITEMS))
+    data = path.read_bytes()
+
+    truncated = snapshot_dir / "truncated.bin"
+    truncated.write_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        snapshot.Snapshot(truncated)
+
+    foreign = snapshot_dir / "foreign.bin"
+    foreign.write_bytes(b"ZCTA" + data[4:])
+    with pytest.raises(ValueError):
+        snapshot.Snapshot(foreign)
+
+    with pytest.raises(ValueError):
+        snapshot.build("v" + "x" * 40, "[]")
+
+
+def test_keeps_only_the_newest_snapshots(snapshot_dir):
+    for ver in range(snapshot.SNAPSHOTS_KEPT + 2):
+        snapshot.build(f"v{ver}", "[]")
+    assert len(list(snapshot_dir.glob("catalog-*.bin"))) == snapshot.SNAPSHOTS_KEPT
+
+
+@pytest.mark.anyio
+async def test_get_maps_a_snapshot_another_worker_built():
+    snapshot.build("vabc-7", json.dumps(ITEMS))
+
+    async def fetch():
+        raise AssertionError("the list should not be fetched")
+
+    snap = await snapshot.get("vabc-7", fetch)
+    assert snap.count == 4
+    assert await snapshot.get("vabc-7", fetch) is snap
+
+
+@pytest.mark.anyio
+async def test_get_builds_a_new_version_from_the_fetched_list():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return "vabc-8", json.dumps(ITEMS[:2])
+
+    snap = await snapshot.get("vabc-8", fetch)
+    assert (snap.tag, snap.count, len(calls)) == ("vabc-8", 2, 1)
+    # Without a version (Redis down) the fetched tag decides.
+    snap = await snapshot.get(None, fetch)
+    assert snap.tag == "vabc-8" and len(calls) == 2
@@ -0,0 +1,86 @@
+import io
+import math
+import zipfile
+
+import pytest
+
+import zipindex
+
+
+GAZETTEER = (
+    "GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG                  \n"
+    "10035\t1\t1\t1\t1\t40.795\t-73.930\n"
+    "00601\t1\t1\t1\t1\t18.180555\t-66.749961       \n"
+    "99999X\t1\t1\t1\t1\t1\t1\n"
+    "94103\t1\t1\t1\t1\t37.772\t-122.411\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def no_loaded_index(monkeypatch):
+    monkeypatch.setattr(zipindex, "_index", None)
+
+
+def _close(a, b):
+    return math.isclose(a[0], b[0], abs_tol=1e-4) and math.isclose(a[1], b[1], abs_tol=1e-4)
+
+
+def test_round_trip(tmp_path):
+    source = tmp_path / "gaz.txt"
+    source.write_text(GAZETTEER)
+    dest = tmp_path / "data" / "zips.bin"
+    assert zipindex.build(source, dest) == 3
+
+    index = zipindex.ZipIndex(dest)
+    try:
+        assert index.count == 3
+        assert _close(index.lookup("10035"), (-73.93, 40.795))
+        assert _close(index.lookup("00601"), (-66.749961, 18.180555))
+        assert _close(index.lookup("94103"), (-122.411, 37.772))
+        assert index.lookup("10036") is None
+        assert index.lookup("00000") is None
+        assert index.lookup("99999") is None
+    finally:
+        index.close()
+
+
+def test_builds_from_zipped_csv(tmp_path):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("gaz.txt", GAZETTEER.replace("\t", ","))
+    source = tmp_path / "gaz.zip"
+    source.write_bytes(buf.getvalue())
+    dest = tmp_path / "zips.bin"
+    assert zipindex.build(source, dest) == 3
+
+
+def test_rejects_bad_files(tmp_path):
+    source = tmp_path / "gaz.txt"
+    source.write_text(GAZETTEER)
+    dest = tmp_path / "zips.bin"
+    zipindex.build(source, dest)
+    data = dest.read_bytes()
+
+    dest.write_bytes(data[:-4])
+    with pytest.raises(ValueError):
+        zipindex.ZipIndex(dest)
+    dest.write_bytes(b"CSNP" + data[4:])
+    with pytest.raises(ValueError):
+        zipindex.ZipIndex(dest)
+
+
+def test_load(tmp_path):
+    missing = tmp_path / "missing.bin"
+    zipindex.load(missing, required=False)
+    assert zipindex.lookup("10035") is None
+    with pytest.raises(RuntimeError):
+        zipindex.load(missing, required=True)
+
+    source = tmp_path / "gaz.txt"
+    source.write_text(GAZETTEER)
+    zipindex.build(source, tmp_path / "zips.bin")
+    zipindex.load(tmp_path / "zips.bin")
+    try:
+        assert _close(zipindex.lookup("10035"), (-73.93, 40.795))
+    finally:
+        zipindex.close()
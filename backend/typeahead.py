@@ -0,0 +1,130 @@
+# typeahead.py
+"""
+Upstream handling for the /api/suggest and /api/retrieve proxies.
+
+- Results are kept in a small per-worker LRU for SUGGEST_CACHE_TTL seconds.
+- Identical queries in flight share one Mapbox call, whoever sent them.
+  The call is cancelled if every request waiting on it goes away.
+- A newer query from the same session_token supersedes the older one:
+  the older request stops waiting and gets 409, so a slow response to
+  "1000" can never overwrite the results for "10001".
+
+Zip codes are resolved by /api/zip from the local centroid index
+(zipindex.py); only codes missing from it come through here.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+import metrics
+from geocode import mapbox_get
+
+
+SUGGEST_CACHE_TTL = float(os.getenv("SUGGEST_CACHE_TTL", "300"))
+SUGGEST_CACHE_SIZE = int(os.getenv("SUGGEST_CACHE_SIZE", "5000"))
+
+# Parameters that identify a session or credential, not the query.
+_NOT_PART_OF_KEY = ("access_token", "session_token")
+
+suggest_requests = metrics.Counter(
+    "typeahead_requests_total", "Suggest/retrieve proxy requests by how they were answered.", ("endpoint", "outcome")
+)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+_results: "OrderedDict[tuple, Tuple[float, dict]]" = OrderedDict()
+_inflight: Dict[tuple, _Flight] = {}
+# session_token -> future resolved when a newer query from it arrives
+_latest: Dict[str, asyncio.Future] = {}
+
+
+def _key(endpoint: str, url: str, params: dict) -> tuple:
+    return (endpoint, url) + tuple(sorted((k, str(v)) for k, v in params.items() if k not in _NOT_PART_OF_KEY))
+
+
+def _cached(key: tuple) -> Optional[dict]:
+    hit = _results.get(key)
+    if hit is None:
+        return None
+    if hit[0] < time.monotonic():
+        del _results[key]
+        return None
+    _results.move_to_end(key)
+    return hit[1]
+
+
+def _store(key: tuple, data: dict) -> None:
+    _results[key] = (time.monotonic() + SUGGEST_CACHE_TTL, data)
+    _results.move_to_end(key)
+    while len(_results) > SUGGEST_CACHE_SIZE:
+        _results.popitem(last=False)
+
+
+async def _call_upstream(endpoint: str, url: str, params: dict, key: tuple) -> dict:
+    r = await mapbox_get(endpoint, url, params)
+    if r.status_code != 200:
+        raise HTTPException(status_code=r.status_code, detail=r.text)
+    data = r.json()
+    _store(key, data)
+    return data
+
+
+def _forget(key: tuple, flight: _Flight) -> None:
+    if _inflight.get(key) is flight:
+        del _inflight[key]
+
+
+async def fetch(endpoint: str, url: str, params: dict, session_token: Optional[str] = None) -> dict:
+    """
+    The upstream JSON for a proxied Mapbox GET, from cache, a shared
+    in-flight call, or a new one. The returned dict is shared; copy it
+    before changing it.
+    """
+    if session_token:
+        previous = _latest.pop(session_token, None)
+        if previous is not None and not previous.done():
+            previous.set_result(None)
+
+    key = _key(endpoint, url, params)
+    data = _cached(key)
+    if data is not None:
+        suggest_requests.inc(endpoint, "cache")
+        return data
+
+    superseded: Optional[asyncio.Future] = None
+    if session_token:
+        superseded = asyncio.get_running_loop().create_future()
+        _latest[session_token] = superseded
+
+    flight = _inflight.get(key)
+    if flight is None:
+        suggest_requests.inc(endpoint, "upstream")
+        flight = _Flight(asyncio.create_task(_call_upstream(endpoint, url, params, key)))
+        _inflight[key] = flight
+        flight.task.add_done_callback(lambda _, f=flight: _forget(key, f))
+    else:
+        suggest_requests.inc(endpoint, "coalesced")
+
+    flight.waiters += 1
+    try:
+        waiting: List[asyncio.Future] = [flight.task] + ([superseded] if superseded else [])
+        await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+        if flight.task.done():
+            return flight.task.result()
+        suggest_requests.inc(endpoint, "superseded")
+        raise HTTPException(status_code=409, detail="Superseded by a newer query for this session")
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+        if session_token and _latest.get(session_token) is superseded:
+            del _latest[session_token]
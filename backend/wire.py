@@ -0,0 +1,103 @@
+# wire.py
+"""
+Content negotiation for the charity read endpoints.
+
+Besides JSON, clients may ask for MessagePack:
+
+    Accept: application/msgpack
+        the same documents as the JSON endpoints, MessagePack-encoded
+    Accept: application/vnd.charities.columnar+msgpack  (/charities only)
+        parallel arrays for map clients: ids, revisions, names, flags, and `coords`
+        as little-endian float32 lon/lat pairs packed into one bin field
+
+msgpack is optional; without it every request is answered with JSON.
+"""
+import json
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+from fastapi import Request, Response
+
+from profiling import span
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNAR = "application/vnd.charities.columnar+msgpack"
+
+# Encoded full lists for the newest list version, per format.
+_list_cache: Dict[str, Tuple[str, bytes]] = {}
+
+
+def negotiate(request: Request, *, columnar: bool = False) -> str:
+    if msgpack is None:
+        return JSON
+    accept = request.headers.get("accept", "")
+    if columnar and COLUMNAR in accept:
+        return COLUMNAR
+    if MSGPACK in accept or "application/x-msgpack" in accept:
+        return MSGPACK
+    return JSON
+
+
+def point(item: dict) -> Tuple[float, float]:
+    """(lon, lat) of a charity entry; NaNs when it has no point."""
+    try:
+        lng, lat = item["geojson"]["geometry"]["coordinates"][:2]
+        return float(lng), float(lat)
+    except (KeyError, TypeError, ValueError):
+        return float("nan"), float("nan")
+
+
+def _columns(items: List[dict]) -> dict:
+    coords = array("f")
+    for item in items:
+        coords.extend(point(item))
+    if sys.byteorder == "big":
+        coords.byteswap()
+    return {
+        "ids": [item["id"] for item in items],
+        "revisions": [item["revision"] for item in items],
+        "names": [item["name"] for item in items],
+        "needs_volunteers": [item["needs_volunteers"] for item in items],
+        "needs_donations": [item["needs_donations"] for item in items],
+        "is_approved": [item["is_approved"] for item in items],
+        "coords": coords.tobytes(),
+    }
+
+
+def encode_list(fmt: str, tag: str, body: str) -> bytes:
+    """Encode the JSON list body tagged `tag`; each version is encoded once per format."""
+    cached = _list_cache.get(fmt)
+    if cached is not None and cached[0] == tag:
+        return cached[1]
+    with span("serialize", fmt):
+        items = json.loads(body)
+        payload = _columns(items) if fmt == COLUMNAR else items
+        encoded = msgpack.packb(payload, use_bin_type=True)
+    _list_cache[fmt] = (tag, encoded)
+    return encoded
+
+
+def encode_entry(body: str) -> bytes:
+    """Re-encode one cached JSON document."""
+    with span("serialize", MSGPACK):
+        return msgpack.packb(json.loads(body), use_bin_type=True)
+
+
+def etag(tag: str, fmt: str) -> str:
+    """Each format is a different representation, so it gets its own ETag."""
+    suffix = {JSON: "", MSGPACK: "-mp", COLUMNAR: "-col"}[fmt]
+    return f'"{tag}{suffix}"'
+
+
+def respond(fmt: str, content: Union[bytes, str], headers: Optional[dict] = None) -> Response:
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept"
+    return Response(content=content, media_type=fmt, headers=headers)
@@ -0,0 +1,182 @@
+# zipindex.py
+"""
+Offline US zip code -> centroid lookups for the zip search on the maps.
+
+The table lives in a small binary file that is memory-mapped at startup
+and searched in place, so a lookup costs a binary search and no network:
+
+    header   magic b"ZCTA", u16 version, u16 reserved, u32 count
+    codes    u32[count]    zip codes as integers, ascending
+    coords   f32[count*2]  lon, lat per code, same order
+
+All little-endian. The table is a build artifact, not checked in. Build
+it from the Census Bureau's ZCTA gazetteer (public domain,
+https://www.census.gov/geographies/reference-files/time-series/geo/gazetteer-files.html)
+with
+
+    python zipindex.py                      # downloads ZCTA_GAZETTEER_URL
+    python zipindex.py 2024_Gaz_zcta_national.zip data/zip_centroids.bin
+
+CI runs the first form and publishes the file as an artifact; deploys
+copy it to ZIP_INDEX_PATH. Without the file /api/zip goes to Mapbox for
+every code, which startup logs as an error; set ZIP_INDEX_REQUIRED=1 to
+refuse to start instead.
+"""
+import bisect
+import io
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Optional, Tuple
+
+
+ZIP_INDEX_PATH = Path(os.getenv("ZIP_INDEX_PATH", Path(__file__).parent / "data" / "zip_centroids.bin"))
+ZIP_INDEX_REQUIRED = os.getenv("ZIP_INDEX_REQUIRED", "").lower() in ("1", "true", "yes")
+ZCTA_GAZETTEER_URL = os.getenv(
+    "ZCTA_GAZETTEER_URL",
+    "https://www2.census.gov/geo/docs/maps-data/data/gazetteer/2024_Gazetteer/2024_Gaz_zcta_national.zip",
+)
+
+MAGIC = b"ZCTA"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHI")
+
+logger = logging.getLogger(__name__)
+
+
+class ZipIndex:
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} zip index")
+        if len(self._mm) != _HEADER.size + count * 12:
+            self._mm.close()
+            raise ValueError(f"{path} is truncated")
+        self.count = count
+
+        start = _HEADER.size
+        if sys.byteorder == "little":
+            view = memoryview(self._mm)
+            self._codes = view[start:start + count * 4].cast("I")
+            self._coords = view[start + count * 4:].cast("f")
+        else:
+            self._codes = array("I", self._mm[start:start + count * 4])
+            self._coords = array("f", self._mm[start + count * 4:])
+            self._codes.byteswap()
+            self._coords.byteswap()
+
+    def lookup(self, code: str) -> Optional[Tuple[float, float]]:
+        """(lon, lat) for a 5-digit zip code, or None if it isn't in the table."""
+        n = int(code)
+        i = bisect.bisect_left(self._codes, n)
+        if i == self.count or self._codes[i] != n:
+            return None
+        return self._coords[2 * i], self._coords[2 * i + 1]
+
+    def close(self) -> None:
+        if isinstance(self._codes, memoryview):
+            self._codes.release()
+            self._coords.release()
+        self._mm.close()
+
+
+_index: Optional[ZipIndex] = None
+
+
+def load(path: Path = ZIP_INDEX_PATH, required: bool = ZIP_INDEX_REQUIRED) -> None:
+    """Map the index; raises RuntimeError if it can't be loaded and `required` is set."""
+    global _index
+    try:
+        _index = ZipIndex(path)
+    except (OSError, ValueError) as e:
+        if required:
+            raise RuntimeError(f"zip index {path} could not be loaded: {e}") from e
+        logger.error(
+            "zip index %s could not be loaded (%s); every /api/zip lookup will go to Mapbox. "
+            "Build it with `python zipindex.py`.", path, e,
+        )
+        return
+    logger.info("loaded %d zip centroids from %s", _index.count, path)
+
+
+def close() -> None:
+    global _index
+    if _index is not None:
+        _index.close()
+        _index = None
+
+
+def lookup(code: str) -> Optional[Tuple[float, float]]:
+    return _index.lookup(code) if _index is not None else None
+
+
+def _open_gazetteer(source: str) -> io.TextIOBase:
+    """The gazetteer text from a path or URL, either of the .txt itself or of a .zip holding it."""
+    import zipfile
+    if source.startswith(("http://", "https://")):
+        from urllib.request import urlopen
+        with urlopen(source, timeout=60) as resp:
+            data = resp.read()
+    else:
+        data = Path(source).read_bytes()
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = [n for n in archive.namelist() if n.endswith(".txt")]
+            if len(names) != 1:
+                raise ValueError(f"expected one .txt file in {source}, found {names}")
+            data = archive.read(names[0])
+    return io.StringIO(data.decode("utf-8-sig"), newline="")
+
+
+def build(source: str, dest: Path) -> int:
+    """
+    Write an index from a gazetteer (tab- or comma-separated, with
+    GEOID/INTPTLAT/INTPTLONG columns) at a path or URL, plain or zipped.
+    """
+    import csv
+    with _open_gazetteer(str(source)) as f:
+        dialect = "excel-tab" if "\t" in f.readline() else "excel"
+        f.seek(0)
+        reader = csv.reader(f, dialect)
+        header = [h.strip().upper() for h in next(reader)]
+        geoid, lat, lon = header.index("GEOID"), header.index("INTPTLAT"), header.index("INTPTLONG")
+        rows = sorted(
+            (int(row[geoid]), float(row[lon]), float(row[lat]))
+            for row in reader
+            if row and row[geoid].strip().isdigit() and len(row[geoid].strip()) == 5
+        )
+
+    codes = array("I", (code for code, _, _ in rows))
+    coords = array("f")
+    for _, x, y in rows:
+        coords.extend((x, y))
+    if sys.byteorder != "little":
+        codes.byteswap()
+        coords.byteswap()
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(dest.suffix + ".tmp")
+    with open(tmp, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, VERSION, 0, len(rows)))
+        out.write(codes.tobytes())
+        out.write(coords.tobytes())
+    os.replace(tmp, dest)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        sys.exit(
+            f"usage: python {sys.argv[0]} [gazetteer path or URL, default {ZCTA_GAZETTEER_URL}]"
+            f" [output, default {ZIP_INDEX_PATH}]"
+        )
+    source = sys.argv[1] if len(sys.argv) > 1 else ZCTA_GAZETTEER_URL
+    out = Path(sys.argv[2]) if len(sys.argv) > 2 else ZIP_INDEX_PATH
+    print(f"wrote {build(source, out)} zip codes to {out}")
@@ -0,0 +1,120 @@
+# importtime.py
+"""
+Startup-time benchmark: how long a worker takes to import the app.
+
+Runs `python -X importtime -c "import main"` in fresh interpreters from
+backend/ and reports the median import time, the median wall time of the
+whole process (interpreter start included), and the modules the app
+imports directly ranked by their median cumulative import time:
+
+    python importtime.py --runs 15 --out results/importtime.json
+    python importtime.py --baseline results/importtime.json
+
+Importing the app creates the engines but opens no connections, so
+Postgres and Redis need not be running.
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_once(module: str) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.exit(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    # A module's line comes after those of the modules it imported.
+    total_us = 0
+    children: Dict[str, int] = {}
+    pending: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative, depth, name = int(m.group(2)), (len(m.group(3)) - 1) // 2, m.group(4)
+        if depth == 1:
+            pending[name] = cumulative
+        elif depth == 0:
+            if name == module:
+                total_us, children = cumulative, pending
+            pending = {}
+    return {"wall_s": wall, "import_us": total_us, "children": children}
+
+
+def run(module: str, runs: int) -> dict:
+    samples = [run_once(module) for _ in range(runs)]
+    per_child: Dict[str, List[int]] = defaultdict(list)
+    for s in samples:
+        for name, us in s["children"].items():
+            per_child[name].append(us)
+    return {
+        "module": module,
+        "runs": runs,
+        "python": sys.version.split()[0],
+        "import_ms": round(statistics.median(s["import_us"] for s in samples) / 1000, 1),
+        "import_min_ms": round(min(s["import_us"] for s in samples) / 1000, 1),
+        "process_ms": round(statistics.median(s["wall_s"] for s in samples) * 1000, 1),
+        "modules_ms": {
+            name: round(statistics.median(values) / 1000, 1)
+            for name, values in sorted(per_child.items(), key=lambda kv: -statistics.median(kv[1]))
+        },
+    }
+
+
+def _delta(new: float, old: Optional[float]) -> str:
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.1f}%)"
+
+
+def print_report(result: dict, baseline: Optional[dict], top: int) -> None:
+    base = baseline or {}
+    print(f"import {result['module']}: {result['runs']} runs, python {result['python']}")
+    print(f"  import   median {result['import_ms']}ms{_delta(result['import_ms'], base.get('import_ms'))}"
+          f"  min {result['import_min_ms']}ms")
+    print(f"  process  median {result['process_ms']}ms{_delta(result['process_ms'], base.get('process_ms'))}")
+    print(f"  slowest direct imports:")
+    old_modules = base.get("modules_ms", {})
+    for name, ms in list(result["modules_ms"].items())[:top]:
+        print(f"    {name:<32} {ms:>8}ms{_delta(ms, old_modules.get(name))}")
+    gone = [name for name in old_modules if name not in result["modules_ms"]]
+    if gone:
+        print(f"  no longer imported: {', '.join(gone)}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="direct imports to list")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previously saved report")
+    args = parser.parse_args()
+
+    result = run(args.module, args.runs)
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_report(result, baseline, args.top)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# loadgen.py
+"""
+Closed-loop load generator for the backend.
+
+Each scenario runs `--concurrency` virtual users for `--duration` seconds
+against a running server and reports throughput and p50/p95/p99 latency
+per endpoint:
+
+    python loadgen.py map --concurrency 64 --duration 30 --out results/map.json
+    python loadgen.py map --baseline results/map.json
+
+Scenarios:
+    map        browse the map: the full list plus individual charities
+    login      login storm against the seeded accounts
+    register   registration burst (geocodes through MAPBOX_API_URL)
+    typeahead  address autocomplete with growing prefixes
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import string
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+
+SEED_PASSWORD = "password123"
+ADDRESSES = [
+    "1600 Pennsylvania Ave NW, Washington, DC 20500",
+    "350 5th Ave, New York, NY 10118",
+    "233 S Wacker Dr, Chicago, IL 60606",
+    "2 Lincoln Memorial Cir NW, Washington, DC 20037",
+    "600 Montgomery St, San Francisco, CA 94111",
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.statuses[name][type(e).__name__] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        self.statuses[name][str(resp.status_code)] += 1
+        if resp.status_code in (429, 503) and "retry-after" in resp.headers:
+            # Back off like a real client instead of hammering a shedding server.
+            await asyncio.sleep(float(resp.headers["retry-after"]))
+        return resp
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(rec: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for name, values in rec.latencies.items():
+        values.sort()
+        endpoints[name] = {
+            "requests": len(values),
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "statuses": dict(rec.statuses[name]),
+        }
+    for name, statuses in rec.statuses.items():
+        endpoints.setdefault(name, {"requests": 0, "statuses": dict(statuses)})
+    return endpoints
+
+
+async def map_user(client, rec, ids, deadline):
+    while time.monotonic() < deadline:
+        await rec.call(client, "GET /charities", "GET", "/charities")
+        for _ in range(3):
+            if ids:
+                await rec.call(client, "GET /charities/{id}", "GET", f"/charities/{random.choice(ids)}")
+
+
+async def login_user(client, rec, usernames, deadline):
+    while time.monotonic() < deadline:
+        payload = {"username": random.choice(usernames), "password": SEED_PASSWORD}
+        await rec.call(client, "POST /charities/login", "POST", "/charities/login", json=payload)
+        client.cookies.clear()
+
+
+async def register_user(client, rec, run_id, deadline):
+    n = 0
+    while time.monotonic() < deadline:
+        n += 1
+        suffix = "".join(random.choices(string.ascii_lowercase, k=6))
+        payload = {
+            "username": f"b{run_id}{suffix}{n}"[:30],
+            "password": "benchpass",
+            "name": f"Bench Charity {suffix}",
+            "address": f"{random.randint(1, 9999)} {random.choice(ADDRESSES)}",
+            "contact": "bench@example.org",
+        }
+        await rec.call(client, "POST /charities", "POST", "/charities", json=payload)
+
+
+async def typeahead_user(client, rec, deadline):
+    while time.monotonic() < deadline:
+        address = random.choice(ADDRESSES)
+        token = str(uuid.uuid4())
+        for end in range(3, len(address) + 1, 2):
+            if time.monotonic() >= deadline:
+                break
+            params = {"q": address[:end], "session_token": token, "limit": 5, "types": "address"}
+            await rec.call(client, "GET /api/suggest", "GET", "/api/suggest", params=params)
+            await asyncio.sleep(random.uniform(0.05, 0.15))
+
+
+async def run(args) -> dict:
+    rec = Recorder()
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as setup:
+        catalog = (await setup.get("/charities")).json()
+    ids = [c["id"] for c in catalog]
+    usernames = [c["username"] for c in catalog]
+    run_id = uuid.uuid4().hex[:4]
+
+    deadline = time.monotonic() + args.duration
+    clients = [
+        httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, follow_redirects=False)
+        for _ in range(args.concurrency)
+    ]
+    if args.scenario == "map":
+        users = [map_user(c, rec, ids, deadline) for c in clients]
+    elif args.scenario == "login":
+        users = [login_user(c, rec, usernames, deadline) for c in clients]
+    elif args.scenario == "register":
+        users = [register_user(c, rec, run_id, deadline) for c in clients]
+    else:
+        users = [typeahead_user(c, rec, deadline) for c in clients]
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*users)
+    finally:
+        await asyncio.gather(*(c.aclose() for c in clients))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 2),
+        "host": {"python": platform.python_version(), "machine": platform.machine()},
+        "endpoints": summarize(rec, elapsed),
+    }
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.1f}%)"
+
+
+def print_report(result: dict, baseline: Optional[dict]) -> None:
+    base = (baseline or {}).get("endpoints", {})
+    print(f"scenario={result['scenario']} concurrency={result['concurrency']} duration={result['duration_s']}s")
+    for name, ep in sorted(result["endpoints"].items()):
+        old = base.get(name, {})
+        print(f"  {name}")
+        print(f"    rps {ep.get('rps', 0)}{_delta(ep.get('rps', 0), old.get('rps', 0))}")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in ep:
+                print(f"    {key[:-3]} {ep[key]}ms{_delta(ep[key], old.get(key, 0))}")
+        print(f"    statuses {ep['statuses']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=["map", "login", "register", "typeahead"])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previously saved report")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
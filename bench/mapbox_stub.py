@@ -0,0 +1,114 @@
+# mapbox_stub.py
+"""
+Offline stand-in for the Mapbox endpoints the backend calls.
+
+Answers geocoding (single and batch), suggest and retrieve with deterministic coordinates
+derived from the query, after a configurable delay:
+
+    MAPBOX_STUB_LATENCY_MS=80 MAPBOX_STUB_JITTER_MS=20 \
+        uvicorn mapbox_stub:app --port 8081
+
+then start the backend with MAPBOX_API_URL=http://localhost:8081.
+"""
+import asyncio
+import hashlib
+import os
+import random
+from typing import List, Optional
+
+from fastapi import Body, FastAPI, Query
+from fastapi.responses import JSONResponse
+
+
+LATENCY_MS = float(os.getenv("MAPBOX_STUB_LATENCY_MS", "80"))
+JITTER_MS = float(os.getenv("MAPBOX_STUB_JITTER_MS", "20"))
+# Fraction of requests answered with a 503, to exercise error paths.
+ERROR_RATE = float(os.getenv("MAPBOX_STUB_ERROR_RATE", "0"))
+
+app = FastAPI()
+
+
+def _point(seed: str) -> list:
+    """Stable pseudo-random point inside the continental US for `seed`."""
+    digest = hashlib.sha1(seed.lower().encode("utf-8")).digest()
+    lng = -124.0 + (int.from_bytes(digest[:4], "big") / 2**32) * 57.0
+    lat = 25.0 + (int.from_bytes(digest[4:8], "big") / 2**32) * 24.0
+    return [round(lng, 5), round(lat, 5)]
+
+
+async def _delay() -> Optional[JSONResponse]:
+    await asyncio.sleep(max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return JSONResponse({"message": "stub error"}, status_code=503)
+    return None
+
+
+@app.get("/geocoding/v5/mapbox.places/{query}.json")
+async def geocode(query: str):
+    if (err := await _delay()) is not None:
+        return err
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "place_name": query,
+                "geometry": {"type": "Point", "coordinates": _point(query)},
+            }
+        ],
+    }
+
+
+@app.post("/search/geocode/v6/batch")
+async def geocode_batch(queries: List[dict] = Body(...)):
+    if (err := await _delay()) is not None:
+        return err
+    return {
+        "batch": [
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "geometry": {"type": "Point", "coordinates": _point(q["q"])},
+                        "properties": {"full_address": q["q"]},
+                    }
+                ],
+            }
+            for q in queries
+        ],
+    }
+
+
+@app.get("/search/searchbox/v1/suggest")
+async def suggest(q: str, limit: int = Query(5), session_token: Optional[str] = None, types: Optional[str] = None):
+    if (err := await _delay()) is not None:
+        return err
+    return {
+        "suggestions": [
+            {
+                "name": f"{q} {i}" if i else q,
+                "mapbox_id": hashlib.sha1(f"{q}:{i}".encode("utf-8")).hexdigest(),
+                "full_address": f"{q} {i}, Springfield, US",
+                "feature_type": "postcode" if types == "postcode" else "address",
+            }
+            for i in range(limit)
+        ],
+        "attribution": "stub",
+    }
+
+
+@app.get("/search/searchbox/v1/retrieve/{mapbox_id}")
+async def retrieve(mapbox_id: str, session_token: Optional[str] = None):
+    if (err := await _delay()) is not None:
+        return err
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": _point(mapbox_id)},
+                "properties": {"mapbox_id": mapbox_id, "full_address": mapbox_id},
+            }
+        ],
+    }
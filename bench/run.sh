@@ -0,0 +1,47 @@
+#!/usr/bin/env bash
+# Run every scenario against a local stack and save the reports.
+#
+#   bench/run.sh                 # writes bench/results/<git sha>/
+#   BASELINE=bench/results/baseline bench/run.sh
+#
+# Postgres and Redis come from the repo's docker-compose.yml (images must
+# already be pulled); Mapbox is replaced by bench/mapbox_stub.py, so the
+# whole run works without network access.
+set -euo pipefail
+
+ROOT="$(cd "$(dirname "$0")/.." && pwd)"
+LABEL="${LABEL:-$(git -C "$ROOT" rev-parse --short HEAD)}"
+OUT="$ROOT/bench/results/$LABEL"
+CONCURRENCY="${CONCURRENCY:-32}"
+DURATION="${DURATION:-20}"
+SCENARIOS="${SCENARIOS:-map login register typeahead}"
+STUB_PORT="${STUB_PORT:-8081}"
+APP_PORT="${APP_PORT:-8000}"
+mkdir -p "$OUT"
+
+docker compose -f "$ROOT/docker-compose.yml" up -d db redis
+
+pids=()
+cleanup() { kill "${pids[@]}" 2>/dev/null || true; }
+trap cleanup EXIT
+
+(cd "$ROOT/bench" && uvicorn mapbox_stub:app --port "$STUB_PORT" --log-level warning) &
+pids+=($!)
+
+(cd "$ROOT/backend" && \
+    MAPBOX_API_URL="http://127.0.0.1:$STUB_PORT" MAPBOX_API_TOKEN=stub LOGIN_RATE_LIMIT=1000000000 \
+    uvicorn main:app --port "$APP_PORT" --log-level warning) &
+pids+=($!)
+
+for _ in $(seq 1 60); do
+    curl -fs "http://127.0.0.1:$APP_PORT/health/ready" >/dev/null && break
+    sleep 1
+done
+
+for scenario in $SCENARIOS; do
+    args=(--base-url "http://127.0.0.1:$APP_PORT" --concurrency "$CONCURRENCY" --duration "$DURATION" --out "$OUT/$scenario.json")
+    if [[ -n "${BASELINE:-}" && -f "$BASELINE/$scenario.json" ]]; then
+        args+=(--baseline "$BASELINE/$scenario.json")
+    fi
+    python "$ROOT/bench/loadgen.py" "$scenario" "${args[@]}" | tee "$OUT/$scenario.txt"
+done
@@ -0,0 +1,45 @@
+#!/usr/bin/env bash
+# Compare serving configurations under the same load and save one report
+# per configuration:
+#
+#   bench/serving.sh             # writes bench/results/serving-<git sha>/
+#
+# Configurations:
+#   dev        uvicorn main:app, 1 worker, asyncio loop and h11 parser
+#   tuned-1    serve.py, 1 worker, uvloop + httptools
+#   uvicorn-N  serve.py --server uvicorn, one worker per CPU
+#   gunicorn-N serve.py --server gunicorn (preloaded), one worker per CPU
+set -euo pipefail
+
+ROOT="$(cd "$(dirname "$0")/.." && pwd)"
+LABEL="${LABEL:-serving-$(git -C "$ROOT" rev-parse --short HEAD)}"
+OUT="$ROOT/bench/results/$LABEL"
+CONCURRENCY="${CONCURRENCY:-128}"
+DURATION="${DURATION:-30}"
+SCENARIO="${SCENARIO:-map}"
+APP_PORT="${APP_PORT:-8000}"
+WORKERS="${WORKERS:-$(nproc)}"
+mkdir -p "$OUT"
+
+docker compose -f "$ROOT/docker-compose.yml" up -d db redis
+
+declare -A CONFIGS=(
+    [dev]="uvicorn main:app --port $APP_PORT --loop asyncio --http h11 --log-level warning"
+    [tuned-1]="python serve.py --server uvicorn --workers 1 --port $APP_PORT"
+    [uvicorn-$WORKERS]="python serve.py --server uvicorn --workers $WORKERS --port $APP_PORT"
+    [gunicorn-$WORKERS]="python serve.py --server gunicorn --workers $WORKERS --port $APP_PORT"
+)
+
+for name in dev tuned-1 "uvicorn-$WORKERS" "gunicorn-$WORKERS"; do
+    (cd "$ROOT/backend" && LOGIN_RATE_LIMIT=1000000000 exec ${CONFIGS[$name]}) &
+    pid=$!
+    for _ in $(seq 1 60); do
+        curl -fs "http://127.0.0.1:$APP_PORT/health/ready" >/dev/null && break
+        sleep 1
+    done
+    echo "== $name"
+    python "$ROOT/bench/loadgen.py" "$SCENARIO" --base-url "http://127.0.0.1:$APP_PORT" \
+        --concurrency "$CONCURRENCY" --duration "$DURATION" --out "$OUT/$name.json" | tee "$OUT/$name.txt"
+    kill "$pid"
+    wait "$pid" 2>/dev/null || true
+done
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Allow streaming replication connections for the optional read replica
+# (docker compose --profile replica up). Runs once, on first initialization.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -18,6 +18,7 @@ interface Charity {
 
 interface EditFormData {
   name: string;
+  address: string;
   description: string;
   website: string;
   contact: string;
@@ -29,6 +30,7 @@ export default function EditPage() {
   const [charity, setCharity] = useState<Charity | null>(null);
   const [formData, setFormData] = useState<EditFormData>({
     name: "",
+    address: "",
     description: "",
     website: "",
     contact: "",
@@ -72,6 +74,7 @@ export default function EditPage() {
         // Pre-fill form with existing data
         setFormData({
           name: data.name,
+          address: data.address,
           description: data.description,
           website: data.website,
           contact: data.contact,
@@ -122,6 +125,11 @@ export default function EditPage() {
       return;
     }
 
+    if (formData.address.length < 5) {
+      setError("Address must be at least 5 characters");
+      return;
+    }
+
     // Validate website only if provided
     if (formData.website.length > 0 && !urlRegex.test(formData.website)) {
       setError(
@@ -346,6 +354,27 @@ export default function EditPage() {
                 />
               </div>
 
+              {/* Address Field */}
+              <div>
+                <label
+                  htmlFor="address"
+                  className="block text-sm font-medium text-[#004225] mb-1"
+                >
+                  Address <span className="text-red-500">*</span>
+                </label>
+                <input
+                  type="text"
+                  id="address"
+                  name="address"
+                  value={formData.address}
+                  onChange={handleChange}
+                  placeholder="Street address, city, state and zip"
+                  required
+                  minLength={5}
+                  className="w-full px-4 py-2 border-2 border-[#004225] rounded-lg focus:outline-none focus:ring-2 focus:ring-[#FFB000] focus:border-transparent text-[#004225] bg-[#F5F5DC]"
+                />
+              </div>
+
               {/* Contact Field */}
               <div>
                 <label
@@ -170,50 +170,22 @@ export default function IndexPage() {
     setSearchError(null);
 
     try {
-      // Step 1: Use /api/suggest to search for the zip code
-      // This endpoint searches Mapbox and returns suggestions
-      const suggestResponse = await fetch(
-        `${API_BASE_URL}/api/suggest?q=${zipCode}&limit=1&types=postcode`
-      );
+      // Step 1: Look up the zip code's center point. The backend answers
+      // from its local zip index and only asks Mapbox for unknown codes.
+      const zipResponse = await fetch(`${API_BASE_URL}/api/zip/${zipCode}`);
 
-      if (!suggestResponse.ok) {
-        throw new Error("Failed to search zip code");
-      }
-
-      const suggestData = await suggestResponse.json();
-      
-      // Check if we got any results
-      if (!suggestData.suggestions || suggestData.suggestions.length === 0) {
+      if (zipResponse.status === 404) {
         setSearchError("Zip code not found. Please try another.");
-        setIsSearching(false);
         return;
       }
 
-      // Get the mapbox_id from the first suggestion
-      const mapboxId = suggestData.suggestions[0].mapbox_id;
-
-      // Step 2: Use /api/retrieve to get full details including coordinates
-      // This endpoint retrieves complete information about the location
-      const retrieveResponse = await fetch(
-        `${API_BASE_URL}/api/retrieve/${mapboxId}`
-      );
-
-      if (!retrieveResponse.ok) {
-        throw new Error("Failed to retrieve location details");
-      }
-
-      const retrieveData = await retrieveResponse.json();
-      
-      // Extract coordinates from the response
-      const coordinates = retrieveData.features[0]?.geometry?.coordinates;
-      
-      if (!coordinates || coordinates.length !== 2) {
-        throw new Error("Invalid coordinates received");
+      if (!zipResponse.ok) {
+        throw new Error("Failed to search zip code");
       }
 
-      const [lng, lat] = coordinates;
+      const { longitude: lng, latitude: lat } = await zipResponse.json();
 
-      // Step 3: Center the map on the zip code location with smooth animation
+      // Step 2: Center the map on the zip code location with smooth animation
       if (map.current) {
         map.current.flyTo({
           center: [lng, lat],
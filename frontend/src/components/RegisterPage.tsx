@@ -44,6 +44,8 @@ export default function RegisterPage() {
 
   // Debounce timer
   const debounceTimerRef = useRef<number | null>(null);
+  // In-flight suggestion request, aborted when a newer query starts
+  const suggestAbortRef = useRef<AbortController | null>(null);
 
   // Fetch address suggestions from backend
   const fetchAddressSuggestions = async (query: string) => {
@@ -53,6 +55,10 @@ export default function RegisterPage() {
       return;
     }
 
+    suggestAbortRef.current?.abort();
+    const controller = new AbortController();
+    suggestAbortRef.current = controller;
+
     setIsLoadingSuggestions(true);
     try {
       const params = new URLSearchParams({
@@ -69,8 +75,14 @@ export default function RegisterPage() {
         headers: {
           "Content-Type": "application/json",
         },
+        signal: controller.signal,
       });
 
+      // 409: the server dropped this query for a newer one from this session
+      if (response.status === 409) {
+        return;
+      }
+
       if (!response.ok) {
         console.error("Failed to fetch address suggestions");
         setAddressSuggestions([]);
@@ -88,10 +100,15 @@ export default function RegisterPage() {
       setAddressSuggestions(suggestions);
       setShowSuggestions(suggestions.length > 0);
     } catch (err) {
+      if (err instanceof DOMException && err.name === "AbortError") {
+        return;
+      }
       console.error("Error fetching address suggestions:", err);
       setAddressSuggestions([]);
     } finally {
-      setIsLoadingSuggestions(false);
+      if (suggestAbortRef.current === controller) {
+        setIsLoadingSuggestions(false);
+      }
     }
   };
 
@@ -118,6 +135,10 @@ export default function RegisterPage() {
 
   // Handle suggestion selection
   const handleSuggestionSelect = async (suggestion: AddressSuggestion) => {
+    suggestAbortRef.current?.abort();
+    const controller = new AbortController();
+    suggestAbortRef.current = controller;
+
     setIsLoadingSuggestions(true);
     try {
       const params = new URLSearchParams({
@@ -27,43 +27,98 @@ interface Charity {
   };
 }
 
+type Change =
+  | { op: "upsert"; charity: Charity }
+  | { op: "delete"; id: number };
+
 export default function VolunteerMapDashboard() {
   const [filteredCharities, setFilteredCharities] = useState<Charity[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const mapContainer = useRef<HTMLDivElement>(null);
   const map = useRef<mapboxgl.Map | null>(null);
+  const markers = useRef<mapboxgl.Marker[]>([]);
   
   // Zip code search state
   const [zipCode, setZipCode] = useState("");
   const [isSearching, setIsSearching] = useState(false);
   const [searchError, setSearchError] = useState<string | null>(null);
 
+  const needsHelp = (charity: Charity) =>
+    charity.needs_volunteers || charity.needs_donations;
+
+  const applyChange = (list: Charity[], change: Change): Charity[] => {
+    if (change.op === "delete") {
+      return list.filter((c) => c.id !== change.id);
+    }
+    const rest = list.filter((c) => c.id !== change.charity.id);
+    return needsHelp(change.charity) ? [...rest, change.charity] : rest;
+  };
+
+  // One buffer per list fetch in flight: changes that arrive while it
+  // runs are replayed on top of the list it returns, which may predate them
+  const pendingChanges = useRef<Change[][]>([]);
+
   // Fetch charities data and filter
+  const fetchCharities = async () => {
+    const pending: Change[] = [];
+    pendingChanges.current.push(pending);
+    try {
+      const response = await fetch(`${API_BASE_URL}/charities`);
+      if (!response.ok) {
+        throw new Error("Failed to fetch charities");
+      }
+      const data: Charity[] = await response.json();
+
+      // Filter to only show charities that need volunteers OR donations
+      setFilteredCharities(pending.reduce(applyChange, data.filter(needsHelp)));
+    } catch (err) {
+      setError(
+        err instanceof Error ? err.message : "An error occurred"
+      );
+    } finally {
+      pendingChanges.current = pendingChanges.current.filter((p) => p !== pending);
+      setIsLoading(false);
+    }
+  };
+
+  const onChange = (change: Change) => {
+    pendingChanges.current.forEach((p) => p.push(change));
+    setFilteredCharities((prev) => applyChange(prev, change));
+  };
+
+  // Stay live: apply per-charity changes instead of refetching the list.
+  // The stream opens first and the list is fetched on `ready`, so every
+  // change after the list's snapshot arrives as an event.
   useEffect(() => {
-    const fetchCharities = async () => {
-      try {
-        const response = await fetch(`${API_BASE_URL}/charities`);
-        if (!response.ok) {
-          throw new Error("Failed to fetch charities");
-        }
-        const data: Charity[] = await response.json();
-        
-        // Filter to only show charities that need volunteers OR donations
-        const filtered = data.filter(
-          (charity) => charity.needs_volunteers || charity.needs_donations
-        );
-        setFilteredCharities(filtered);
-      } catch (err) {
-        setError(
-          err instanceof Error ? err.message : "An error occurred"
-        );
-      } finally {
-        setIsLoading(false);
+    const source = new EventSource(`${API_BASE_URL}/charities/changes`);
+    let ready = false;
+    let fellBack = false;
+
+    source.addEventListener("ready", () => {
+      ready = true;
+      fetchCharities();
+    });
+    source.addEventListener("upsert", (e) => {
+      onChange({ op: "upsert", charity: JSON.parse((e as MessageEvent).data) });
+    });
+    source.addEventListener("delete", (e) => {
+      onChange({ op: "delete", id: JSON.parse((e as MessageEvent).data).id });
+    });
+    // The server could not replay everything we missed while disconnected
+    source.addEventListener("reset", () => {
+      fetchCharities();
+    });
+    // Without the stream, still show the list; `ready` refetches it once
+    // the stream connects
+    source.onerror = () => {
+      if (!ready && !fellBack) {
+        fellBack = true;
+        fetchCharities();
       }
     };
 
-    fetchCharities();
+    return () => source.close();
   }, []);
 
   // Determine marker color based on needs
@@ -84,7 +139,7 @@ export default function VolunteerMapDashboard() {
 
   // Initialize map and add markers
   useEffect(() => {
-    if (!mapContainer.current || isLoading || error || filteredCharities.length === 0) {
+    if (!mapContainer.current || isLoading || error || (!map.current && filteredCharities.length === 0)) {
       return;
     }
 
@@ -118,77 +173,84 @@ export default function VolunteerMapDashboard() {
 
       // Add navigation controls
       map.current.addControl(new mapboxgl.NavigationControl(), "top-right");
+    }
+
+    // Replace the markers, keeping the map and its viewport
+    markers.current.forEach((marker) => marker.remove());
+    markers.current = [];
+
+    // Add markers for each filtered charity
+    filteredCharities.forEach((charity) => {
+      if (!charity.geojson?.geometry?.coordinates) {
+        console.warn(`Charity ${charity.id} missing coordinates`);
+        return;
+      }
 
-      // Add markers for each filtered charity
-      filteredCharities.forEach((charity) => {
-        if (!charity.geojson?.geometry?.coordinates) {
-          console.warn(`Charity ${charity.id} missing coordinates`);
-          return;
-        }
-
-        const [lng, lat] = charity.geojson.geometry.coordinates;
-        const markerColor = getMarkerColor(charity);
-
-        // Create popup content
-        const popupContent = `
-          <div style="padding: 8px; min-width: 200px;">
-            <h3 style="margin: 0 0 8px 0; font-size: 16px; font-weight: bold; color: #004225;">
-              ${charity.name}
-            </h3>
-            <p style="margin: 0 0 8px 0; font-size: 14px; color: #666;">
-              ${charity.address}
+      const [lng, lat] = charity.geojson.geometry.coordinates;
+      const markerColor = getMarkerColor(charity);
+
+      // Create popup content
+      const popupContent = `
+        <div style="padding: 8px; min-width: 200px;">
+          <h3 style="margin: 0 0 8px 0; font-size: 16px; font-weight: bold; color: #004225;">
+            ${charity.name}
+          </h3>
+          <p style="margin: 0 0 8px 0; font-size: 14px; color: #666;">
+            ${charity.address}
+          </p>
+          ${charity.description ? `
+            <p style="margin: 0 0 8px 0; font-size: 13px; color: #333; max-height: 60px; overflow: hidden;">
+              ${charity.description.substring(0, 100)}${charity.description.length > 100 ? "..." : ""}
             </p>
-            ${charity.description ? `
-              <p style="margin: 0 0 8px 0; font-size: 13px; color: #333; max-height: 60px; overflow: hidden;">
-                ${charity.description.substring(0, 100)}${charity.description.length > 100 ? "..." : ""}
-              </p>
+          ` : ""}
+          <div style="margin-bottom: 8px;">
+            ${charity.needs_volunteers ? `
+              <span style="display: inline-block; padding: 4px 8px; background: #dcfce7; border: 1px solid #16A34A; border-radius: 4px; font-size: 11px; margin-right: 4px; margin-bottom: 4px; color: #166534;">
+                ✓ Needs Volunteers
+              </span>
+            ` : ""}
+            ${charity.needs_donations ? `
+              <span style="display: inline-block; padding: 4px 8px; background: #FFCF9D; border: 1px solid #FFB000; border-radius: 4px; font-size: 11px; margin-bottom: 4px; color: #92400e;">
+                ✓ Needs Donations
+              </span>
             ` : ""}
-            <div style="margin-bottom: 8px;">
-              ${charity.needs_volunteers ? `
-                <span style="display: inline-block; padding: 4px 8px; background: #dcfce7; border: 1px solid #16A34A; border-radius: 4px; font-size: 11px; margin-right: 4px; margin-bottom: 4px; color: #166534;">
-                  ✓ Needs Volunteers
-                </span>
-              ` : ""}
-              ${charity.needs_donations ? `
-                <span style="display: inline-block; padding: 4px 8px; background: #FFCF9D; border: 1px solid #FFB000; border-radius: 4px; font-size: 11px; margin-bottom: 4px; color: #92400e;">
-                  ✓ Needs Donations
-                </span>
-              ` : ""}
-            </div>
-            <a 
-              href="/charities/${charity.id}" 
-              style="display: inline-block; padding: 6px 12px; background: #FFB000; color: #004225; text-decoration: none; border-radius: 6px; font-weight: 600; font-size: 13px; transition: background 0.2s;"
-              onmouseover="this.style.background='#FFCF9D'"
-              onmouseout="this.style.background='#FFB000'"
-            >
-              View Details →
-            </a>
           </div>
-        `;
-
-        // Create popup
-        const popup = new mapboxgl.Popup({
-          offset: 25,
-          closeButton: true,
-          closeOnClick: false,
-        }).setHTML(popupContent);
-
-        // Create marker with color coding
-        new mapboxgl.Marker({ color: markerColor })
-          .setLngLat([lng, lat])
-          .setPopup(popup)
-          .addTo(map.current!);
-      });
-    }
+          <a 
+            href="/charities/${charity.id}" 
+            style="display: inline-block; padding: 6px 12px; background: #FFB000; color: #004225; text-decoration: none; border-radius: 6px; font-weight: 600; font-size: 13px; transition: background 0.2s;"
+            onmouseover="this.style.background='#FFCF9D'"
+            onmouseout="this.style.background='#FFB000'"
+          >
+            View Details →
+          </a>
+        </div>
+      `;
+
+      // Create popup
+      const popup = new mapboxgl.Popup({
+        offset: 25,
+        closeButton: true,
+        closeOnClick: false,
+      }).setHTML(popupContent);
+
+      // Create marker with color coding
+      const marker = new mapboxgl.Marker({ color: markerColor })
+        .setLngLat([lng, lat])
+        .setPopup(popup)
+        .addTo(map.current!);
+      markers.current.push(marker);
+    });
+  }, [filteredCharities, isLoading, error]);
 
-    // Cleanup function
+  // Cleanup function
+  useEffect(() => {
     return () => {
       if (map.current) {
         map.current.remove();
         map.current = null;
       }
     };
-  }, [filteredCharities, isLoading, error]);
+  }, []);
 
   // Handle zip code search and map centering
   const handleZipCodeSearch = async (e: React.FormEvent) => {
@@ -204,48 +266,22 @@ export default function VolunteerMapDashboard() {
     setSearchError(null);
 
     try {
-      // Step 1: Use /api/suggest to search for the zip code
-      const suggestResponse = await fetch(
-        `${API_BASE_URL}/api/suggest?q=${zipCode}&limit=1&types=postcode`
-      );
-
-      if (!suggestResponse.ok) {
-        throw new Error("Failed to search zip code");
-      }
+      // Step 1: Look up the zip code's center point. The backend answers
+      // from its local zip index and only asks Mapbox for unknown codes.
+      const zipResponse = await fetch(`${API_BASE_URL}/api/zip/${zipCode}`);
 
-      const suggestData = await suggestResponse.json();
-      
-      // Check if we got any results
-      if (!suggestData.suggestions || suggestData.suggestions.length === 0) {
+      if (zipResponse.status === 404) {
         setSearchError("Zip code not found. Please try another.");
-        setIsSearching(false);
         return;
       }
 
-      // Get the mapbox_id from the first suggestion
-      const mapboxId = suggestData.suggestions[0].mapbox_id;
-
-      // Step 2: Use /api/retrieve to get full details including coordinates
-      const retrieveResponse = await fetch(
-        `${API_BASE_URL}/api/retrieve/${mapboxId}`
-      );
-
-      if (!retrieveResponse.ok) {
-        throw new Error("Failed to retrieve location details");
-      }
-
-      const retrieveData = await retrieveResponse.json();
-      
-      // Extract coordinates from the response
-      const coordinates = retrieveData.features[0]?.geometry?.coordinates;
-      
-      if (!coordinates || coordinates.length !== 2) {
-        throw new Error("Invalid coordinates received");
+      if (!zipResponse.ok) {
+        throw new Error("Failed to search zip code");
       }
 
-      const [lng, lat] = coordinates;
+      const { longitude: lng, latitude: lat } = await zipResponse.json();
 
-      // Step 3: Center the map on the zip code location with smooth animation
+      // Step 2: Center the map on the zip code location with smooth animation
       if (map.current) {
         map.current.flyTo({
           center: [lng, lat],